@@ -1,11 +1,50 @@
 from sentence_transformers import SentenceTransformer, util
 import numpy as np
+from scipy.optimize import linear_sum_assignment
 import json
 import spacy 
 import logging
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from spacy.lang.en.stop_words import STOP_WORDS as ENGLISH_STOP_WORDS
+import metrics
+from config import (EMBEDDING_MODEL, PREPROCESS_BATCH_SIZE, PREPROCESS_N_PROCESS,
+                    PREPROCESS_MULTIPROCESS_MIN, PREPROCESS_CACHE_SIZE,
+                    PREPROCESS_ROUTES, PREPROCESS_DEFAULT_ROUTE, INPUT_EMBEDDING_CACHE_SIZE,
+                    ENCODE_BATCHING, ENCODE_MAX_BATCH, ENCODE_MAX_WAIT_MS)
 
-# Lazy load spaCy (lightweight)
-nlp = spacy.load('en_core_web_sm')
+# spaCy with only what preprocessing reads (lemma, POS, stopwords); parser and NER are not loaded
+_spacy_started = time.perf_counter()
+nlp = spacy.load('en_core_web_sm', exclude=['parser', 'ner'])
+SPACY_LOAD_SECONDS = time.perf_counter() - _spacy_started
+
+# Fast path: regex tokens minus stopwords, no tagging or lemmatization
+_WORD_RE = re.compile(r'[^\W\d_]+')
+_ARABIC_RE = re.compile('[\u0600-\u06ff\u0750-\u077f]')
+_LATIN_RE = re.compile('[A-Za-z]')
+_ARABIC_MARKS_RE = re.compile('[\u064b-\u0652\u0640]')  # Harakat and tatweel
+_ARABIC_FOLD = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ى': 'ي', 'ة': 'ه'})
+_ARABIC_ARTICLES = ('وال', 'بال', 'فال', 'كال', 'لل', 'ال')  # Definite article, alone or after a one-letter prefix
+ARABIC_STOP_WORDS = frozenset(word.translate(_ARABIC_FOLD) for word in '''
+في من إلى على عن مع هذا هذه ذلك تلك التي الذي الذين هو هي هم أن إن أو ثم كما كل بعض
+قد لا ما لم لن بين حتى عند منذ خلال ضمن حول أي أيضا كان كانت يكون تكون
+'''.split())
+
+# Bounded LRU of preprocessed text, keyed by content hash
+_preprocess_cache = OrderedDict()
+_preprocess_lock = threading.Lock()
+
+# Bounded LRU of input course vectors, keyed by hash of the preprocessed text
+_embedding_cache = OrderedDict()
+_embedding_lock = threading.Lock()
+
+# How a set of course vectors is combined into one: mean, element-wise max, or mean weighted by credits
+SET_POOLING = ('mean', 'max', 'credits')
 
 # Lazy load model (global, load on first use)
 model = None
@@ -14,63 +53,422 @@ def get_model():
     global model
     if model is None:
         logging.debug("Loading SentenceTransformer model...")
-        model = SentenceTransformer('all-MiniLM-L6-v2', device='cpu')
+        model = SentenceTransformer(EMBEDDING_MODEL, device='cpu')
         logging.debug("Model loaded successfully")
     return model
 
 logging.basicConfig(level=logging.DEBUG)
 logging.debug("AI Comparator module loaded")
 
-def preprocess_text(text):
+class _PendingEncode:
+    def __init__(self, texts):
+        self.texts = texts
+        self.done = threading.Event()
+        self.vectors = None
+        self.error = None
+
+class EncodeBatcher:
     """
-    Clean and prepare text using spaCy:
-    - Tokenize, remove stopwords, lemmatize.
-    - Extract key terms (nouns, verbs, adjectives).
-    - Join back into a cleaned string for embedding.
+    Micro-batcher for model.encode: calls arriving from concurrent request
+    threads are queued, and a single worker thread encodes everything that is
+    waiting (up to max_batch_size texts) as one forward pass, then hands each
+    caller its own rows. A call that finds the queue empty goes out at once;
+    only when others are already queued behind it does the worker hold the
+    batch up to max_wait seconds for more.
     """
-    if not text:
-        return ""
-    doc = nlp(text)
-    
+    def __init__(self, encode_fn, max_batch_size=32, max_wait=0.005):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.batched_texts = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+
+    def _ensure_worker(self):
+        # Threads don't survive fork: (re)start the worker in whichever process is calling
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, args=(self._queue,), daemon=True, name='encode-batcher').start()
+                self._pid = os.getpid()
+            return self._queue
+
+    def encode(self, texts):
+        """Encode a list of texts; returns an (n, dim) float32 matrix."""
+        if len(texts) >= self.max_batch_size:
+            return np.asarray(self.encode_fn(texts), dtype=np.float32)
+        pending = _PendingEncode(texts)
+        self._ensure_worker().put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.vectors
+
+    def _run(self, work):
+        while True:
+            batch = [work.get()]
+            size = len(batch[0].texts)
+            # A lone caller shouldn't pay max_wait; a backlog means concurrent traffic worth waiting for
+            deadline = time.monotonic() + (0 if work.empty() else self.max_wait)
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    pending = work.get(timeout=remaining) if remaining > 0 else work.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                size += len(pending.texts)
+
+            texts = [text for pending in batch for text in pending.texts]
+            try:
+                vectors = np.asarray(self.encode_fn(texts), dtype=np.float32)
+                self.batches += 1
+                self.batched_texts += len(texts)
+                offset = 0
+                for pending in batch:
+                    pending.vectors = vectors[offset:offset + len(pending.texts)]
+                    offset += len(pending.texts)
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            for pending in batch:
+                pending.done.set()
+
+def _model_encode(texts):
+    metrics.observe('equiv_encode_batch_size', len(texts), buckets=metrics.SIZE_BUCKETS)
+    return get_model().encode(texts)
+
+_batcher = EncodeBatcher(
+    _model_encode,
+    max_batch_size=ENCODE_MAX_BATCH,
+    max_wait=ENCODE_MAX_WAIT_MS / 1000.0
+)
+
+def encode_processed(texts, batching=ENCODE_BATCHING):
+    """Encode already-preprocessed texts into an (n, dim) float32 matrix."""
+    with metrics.timed('encode'):
+        if batching:
+            return _batcher.encode(texts)
+        return np.asarray(_model_encode(texts), dtype=np.float32)
+
+def _clean_doc(doc):
     tokens = [
         token.lemma_.lower() for token in doc
         if not token.is_stop and not token.is_punct and token.pos_ in ['NOUN', 'VERB', 'ADJ']
     ]
     return ' '.join(tokens)
 
-def compute_equivalency(input_descs, dhofar_courses, is_set=False):
+def fast_preprocess(text):
+    """Lightweight preprocessing: lowercase word tokens, Arabic letter variants folded, stopwords dropped."""
+    text = _ARABIC_MARKS_RE.sub('', text).translate(_ARABIC_FOLD).lower()
+    tokens = []
+    for token in _WORD_RE.findall(text):
+        if len(token) < 2 or token in ENGLISH_STOP_WORDS or token in ARABIC_STOP_WORDS:
+            continue
+        for article in _ARABIC_ARTICLES:
+            if token.startswith(article) and len(token) - len(article) >= 3:
+                token = token[len(article):]
+                break
+        tokens.append(token)
+    return ' '.join(tokens)
+
+def detect_language(text):
+    """'ar' when Arabic letters outnumber Latin ones, otherwise 'en'."""
+    return 'ar' if len(_ARABIC_RE.findall(text)) > len(_LATIN_RE.findall(text)) else 'en'
+
+def preprocess_route(text, language=None):
+    """Pipeline ('spacy' or 'fast') for a text; language is detected from the script when not given."""
+    return PREPROCESS_ROUTES.get(language or detect_language(text or ''), PREPROCESS_DEFAULT_ROUTE)
+
+def _text_key(text, route):
+    return hashlib.sha1(f"{route}\0{text}".encode('utf-8')).hexdigest()
+
+def preprocess_texts(texts, batch_size=PREPROCESS_BATCH_SIZE, n_process=None, languages=None):
+    """
+    Batched version of preprocess_text.
+    Each text is routed by its language (languages, aligned with texts, e.g.
+    UniversityCourse.language; detected when missing) to spaCy or the fast
+    path. Texts already in the cache are returned as-is; the remaining unique
+    spaCy texts are streamed through nlp.pipe, using PREPROCESS_N_PROCESS
+    worker processes when there are at least PREPROCESS_MULTIPROCESS_MIN of them.
+    """
+    results = [""] * len(texts)
+    pending = OrderedDict()  # key -> (text, route, indices waiting on it)
+    hits = 0
+    with _preprocess_lock:
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            route = preprocess_route(text, languages[i] if languages else None)
+            key = _text_key(text, route)
+            if key in _preprocess_cache:
+                _preprocess_cache.move_to_end(key)
+                results[i] = _preprocess_cache[key]
+                hits += 1
+            else:
+                pending.setdefault(key, (text, route, []))[2].append(i)
+
+    metrics.cache_result('preprocess', hits, len(pending))
+    if not pending:
+        return results
+
+    cleaned = {}
+    fast = [(key, text) for key, (text, route, _) in pending.items() if route == 'fast']
+    if fast:
+        with metrics.timed('preprocess_fast'):
+            cleaned.update((key, fast_preprocess(text)) for key, text in fast)
+    full = [(key, text) for key, (text, route, _) in pending.items() if route != 'fast']
+    if full:
+        if n_process is None:
+            n_process = PREPROCESS_N_PROCESS if len(full) >= PREPROCESS_MULTIPROCESS_MIN else 1
+        metrics.observe('equiv_preprocess_batch_size', len(full), buckets=metrics.SIZE_BUCKETS)
+        with metrics.timed('preprocess'):
+            docs = nlp.pipe((text for _, text in full), batch_size=batch_size, n_process=n_process)
+            cleaned.update((key, _clean_doc(doc)) for (key, _), doc in zip(full, docs))
+
+    with _preprocess_lock:
+        for key, (_, _, indices) in pending.items():
+            value = cleaned[key]
+            for i in indices:
+                results[i] = value
+            _preprocess_cache[key] = value
+            _preprocess_cache.move_to_end(key)
+        while len(_preprocess_cache) > PREPROCESS_CACHE_SIZE:
+            _preprocess_cache.popitem(last=False)
+    return results
+
+def preprocess_text(text, language=None):
+    """
+    Clean and prepare text for embedding. English goes through spaCy:
+    - Tokenize, remove stopwords, lemmatize.
+    - Extract key terms (nouns, verbs, adjectives).
+    - Join back into a cleaned string for embedding.
+    Languages routed to 'fast' (Arabic by default) skip spaCy; see fast_preprocess.
+    """
+    if not text:
+        return ""
+    return preprocess_texts([text], languages=[language])[0]
+
+def encode_texts(texts, languages=None):
+    """Preprocess and encode a list of raw descriptions into an (n, dim) float32 matrix."""
+    processed = preprocess_texts(texts, languages=languages)
+    return encode_processed(processed)
+
+def encode_cached(processed_texts):
+    """
+    Encode preprocessed texts, reusing vectors of texts seen recently;
+    the misses go through the model as one batch.
+    """
+    if not processed_texts:
+        return np.empty((0, get_model().get_sentence_embedding_dimension()), dtype=np.float32)
+    keys = [hashlib.sha1(text.encode('utf-8')).hexdigest() for text in processed_texts]
+    vectors = [None] * len(keys)
+    missing = OrderedDict()  # key -> text
+    with _embedding_lock:
+        for i, key in enumerate(keys):
+            if key in _embedding_cache:
+                _embedding_cache.move_to_end(key)
+                vectors[i] = _embedding_cache[key]
+            else:
+                missing[key] = processed_texts[i]
+    metrics.cache_result('input_embeddings', len(keys) - len(missing), len(missing))
+    if missing:
+        encoded = dict(zip(missing, encode_processed(list(missing.values()))))
+        with _embedding_lock:
+            for key, vector in encoded.items():
+                _embedding_cache[key] = vector
+                _embedding_cache.move_to_end(key)
+            while len(_embedding_cache) > INPUT_EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+        vectors = [encoded[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+    return np.vstack(vectors).astype(np.float32)
+
+def _unit_rows(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def _pooling_weights(weights, n):
+    """Credit weights as floats; equal weights when missing, unparsable or all zero."""
+    try:
+        weights = np.array([float(w) for w in weights], dtype=np.float32) if weights is not None else None
+    except (TypeError, ValueError):
+        weights = None
+    if weights is None or len(weights) != n or weights.sum() <= 0:
+        return np.ones(n, dtype=np.float32)
+    return np.clip(weights, 0, None)
+
+def pool_embeddings(vectors, pooling='mean', weights=None):
+    """Combine an (n, dim) matrix of course vectors into one unit vector (see SET_POOLING)."""
+    vectors = _unit_rows(np.asarray(vectors, dtype=np.float32))
+    if pooling == 'max':
+        pooled = vectors.max(axis=0)
+    elif pooling == 'credits':
+        w = _pooling_weights(weights, len(vectors))
+        pooled = w @ vectors / w.sum()
+    else:
+        pooled = vectors.mean(axis=0)
+    return pooled / max(np.linalg.norm(pooled), 1e-12)
+
+def pool_groups(embeddings, groups, pooling='mean', weights=None):
+    """
+    Pool rows of embeddings per group in one pass: groups is a list of
+    non-empty row-index lists, weights (credits) line up with the rows.
+    Returns an (n_groups, dim) matrix of unit vectors.
+    """
+    sizes = np.array([len(group) for group in groups])
+    order = np.concatenate([np.asarray(group, dtype=np.int64) for group in groups])
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    vectors = _unit_rows(np.asarray(embeddings, dtype=np.float32))[order]
+    if pooling == 'max':
+        pooled = np.maximum.reduceat(vectors, starts, axis=0)
+    elif pooling == 'credits':
+        w = _pooling_weights(weights, len(embeddings))[order]
+        totals = np.add.reduceat(w, starts)
+        # A group whose courses all have zero credits falls back to its plain mean
+        w = np.where(np.repeat(totals, sizes) > 0, w, 1.0)
+        pooled = np.add.reduceat(vectors * w[:, None], starts, axis=0) / np.add.reduceat(w, starts)[:, None]
+    else:
+        pooled = np.add.reduceat(vectors, starts, axis=0) / sizes[:, None]
+    return _unit_rows(pooled)
+
+def encode_input(input_descs, is_set=False, pooling='mean', weights=None):
+    """
+    Embed one description, or a set of descriptions: each course is encoded
+    on its own (so long sets aren't truncated and vectors are reused across
+    sets) and the vectors are pooled (see pool_embeddings).
+    """
+    if not input_descs:
+        input_descs = [""]  # An empty set is compared as empty text, as before pooling existed
+    processed = preprocess_texts(input_descs if is_set else input_descs[:1])
+    vectors = encode_cached(processed)
+    if not is_set:
+        return vectors[0]
+    return pool_embeddings(vectors, pooling, weights)
+
+def compute_equivalency(input_descs, dhofar_courses, is_set=False, dhofar_embeddings=None, pooling='mean', weights=None):
+    """
+    Match input description(s) against dhofar_courses.
+    Pass dhofar_embeddings (rows aligned with dhofar_courses, see embedding_store)
+    to skip re-encoding the catalog; otherwise it is encoded on the fly.
+    """
     if not dhofar_courses:
         return None, 0.0
     
-    # Get model (lazy)
-    m = get_model()
+    # Preprocess + encode input
+    input_embedding = encode_input(input_descs, is_set=is_set, pooling=pooling, weights=weights)
     
-    # Preprocess Dhofar courses
-    dhofar_descs = [preprocess_text(course.description or "") for course in dhofar_courses]
-    
-    # Preprocess input
-    if is_set:
-        processed_input_descs = [preprocess_text(desc) for desc in input_descs]
-        combined_input = ' '.join(processed_input_descs)
-        input_embedding = m.encode(combined_input)
-    else:
-        processed_input = preprocess_text(input_descs[0])
-        input_embedding = m.encode(processed_input)
-    
-    # Encode Dhofar
-    dhofar_embeddings = m.encode(dhofar_descs)
+    # Encode Dhofar only if no stored embeddings were supplied
+    if dhofar_embeddings is None:
+        dhofar_embeddings = encode_texts([course.description for course in dhofar_courses],
+                                         languages=[course.language for course in dhofar_courses])
     
     # Similarities
-    similarities = util.cos_sim(input_embedding, dhofar_embeddings)[0]
-    max_idx = np.argmax(similarities)
-    score = float(similarities[max_idx]) * 100
+    with metrics.timed('similarity'):
+        similarities = util.cos_sim(input_embedding, dhofar_embeddings)[0]
+        max_idx = np.argmax(similarities)
+        score = float(similarities[max_idx]) * 100
     
     return dhofar_courses[max_idx], score
 
-def compute_plan_equivalency(input_plan, dhofar_plan):
+def search_equivalents(input_descs, index, is_set=False, k=5, university_id=None, department=None, language=None,
+                       pooling='mean', weights=None):
+    """
+    Index-backed variant of compute_equivalency: search a VectorIndex
+    (see vector_index / embedding_store.get_catalog_index) instead of scanning
+    a course list. Returns up to k (course_id, score) pairs, best first,
+    with scores in percent.
+    """
+    input_embedding = encode_input(input_descs, is_set=is_set, pooling=pooling, weights=weights)
+    with metrics.timed('similarity'):
+        hits = index.search(input_embedding, k=k, university_id=university_id, department=department, language=language)
+    return [(course_id, similarity * 100) for course_id, similarity in hits]
+
+def search_batch(input_descs, index, k=5, university_id=None, department=None, language=None):
+    """
+    search_equivalents for many single courses at once: one encode pass and
+    one matrix search. Returns one list of (course_id, score) pairs per input.
+    """
+    if not input_descs:
+        return []
+    vectors = encode_cached(preprocess_texts(input_descs))
+    with metrics.timed('similarity'):
+        hits = index.search(vectors, k=k, university_id=university_id, department=department, language=language)
+    return [[(course_id, similarity * 100) for course_id, similarity in row] for row in hits]
+
+def top_k_indices(scores, k):
+    """Column indices of the k best scores in each row, best first (argpartition, not a full sort)."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(k), (len(scores), 1))
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+def compute_group_equivalency(input_descs, groups, embeddings, pooling='mean', weights=None, course_weights=None, k=5):
+    """
+    Many-to-many set comparison: the pooled input set against groups of
+    catalog courses (e.g. one group per department), each pooled the same way.
+    groups are row-index lists into embeddings; weights are the input credits,
+    course_weights the catalog credits (rows of embeddings).
+    Returns up to k (group index, score) pairs, best first, scores in percent.
+    """
+    kept = [i for i, group in enumerate(groups) if len(group)]
+    if not kept or not input_descs:
+        return []
+    query = encode_input(input_descs, is_set=True, pooling=pooling, weights=weights)
+    with metrics.timed('similarity'):
+        scores = pool_groups(embeddings, [groups[i] for i in kept], pooling, course_weights) @ query * 100
+        best = np.argsort(-scores)[:k]
+    return [(kept[i], float(scores[i])) for i in best]
+
+def compute_plan_equivalency(input_plan, dhofar_plan, dhofar_embeddings=None, one_to_one=False, k=0):
+    """
+    Match every course of input_plan against dhofar_plan in one pass:
+    all input descriptions are encoded as a single batch and scored through
+    one input x catalog similarity matrix.
+    With one_to_one=True each Dhofar course is claimed by at most one input
+    course (globally optimal assignment); inputs left over get no match.
+    With k > 0 every result also lists its k best 'candidates' as
+    (course, score) pairs, regardless of the assignment.
+    """
+    if not input_plan:
+        return [], 0.0
+    if not dhofar_plan:
+        results = [{'input': input_course, 'matched': None, 'score': 0.0} for input_course in input_plan]
+        if k:
+            for r in results:
+                r['candidates'] = []
+        return results, 0.0
+
+    if dhofar_embeddings is None:
+        dhofar_embeddings = encode_texts([course.description for course in dhofar_plan],
+                                         languages=[course.language for course in dhofar_plan])
+    input_embeddings = encode_texts([input_course['description'] for input_course in input_plan])
+
+    with metrics.timed('similarity'):
+        # Rows = input courses, columns = Dhofar courses, values in percent
+        scores = np.asarray(util.cos_sim(input_embeddings, dhofar_embeddings), dtype=np.float32) * 100
+        top = top_k_indices(scores, k) if k else None
+
+        if one_to_one:
+            best = np.full(len(input_plan), -1)
+            rows, cols = linear_sum_assignment(scores, maximize=True)
+            best[rows] = cols
+        elif top is not None:
+            best = top[:, 0]
+        else:
+            best = np.argmax(scores, axis=1)
+
     results = []
-    for input_course in input_plan:
-        matched, score = compute_equivalency([input_course['description']], dhofar_plan)
-        results.append({'input': input_course, 'matched': matched, 'score': score})
-    overall_score = np.mean([r['score'] for r in results])
-    return results, overall_score
\ No newline at end of file
+    for i, input_course in enumerate(input_plan):
+        j = int(best[i])
+        if j < 0:
+            results.append({'input': input_course, 'matched': None, 'score': 0.0})
+        else:
+            results.append({'input': input_course, 'matched': dhofar_plan[j], 'score': float(scores[i, j])})
+        if top is not None:
+            results[-1]['candidates'] = [(dhofar_plan[j], float(scores[i, j])) for j in top[i]]
+    overall_score = float(np.mean([r['score'] for r in results]))
+    return results, overall_score
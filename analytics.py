@@ -0,0 +1,76 @@
+"""
+Comparison history analytics.
+
+Every query here is a GROUP BY over the history_stats summary table (see
+models.HistoryStats), which is bounded by days x courses x decisions x score
+deciles rather than by the number of comparisons, so the analytics page
+costs the same however large ComparisonHistory grows.
+"""
+from sqlalchemy import case, func
+from models import HistoryStats, UniversityCourse
+
+def _in_range(query, date_from=None, date_to=None):
+    if date_from:
+        query = query.filter(HistoryStats.day >= date_from)
+    if date_to:
+        query = query.filter(HistoryStats.day <= date_to)
+    return query
+
+def totals(session, date_from=None, date_to=None):
+    requests = func.coalesce(func.sum(HistoryStats.requests), 0)
+    accepted = func.coalesce(func.sum(case((HistoryStats.decision == 'accepted', HistoryStats.requests), else_=0)), 0)
+    query = session.query(requests, accepted, func.sum(HistoryStats.score_total))
+    count, accepted_count, score_total = _in_range(query, date_from, date_to).one()
+    return {
+        'requests': count,
+        'accepted': accepted_count,
+        'acceptance_rate': accepted_count / count * 100 if count else 0.0,
+        'avg_score': (score_total or 0.0) / count if count else 0.0
+    }
+
+def course_stats(session, date_from=None, date_to=None, limit=20, min_requests=1, order='requests'):
+    """
+    Per matched course: requests, acceptance rate (%) and average score.
+    order='requests' gives the most requested courses, order='acceptance'
+    the lowest acceptance rates first (courses with at least min_requests).
+    """
+    requests = func.sum(HistoryStats.requests)
+    accepted = func.sum(case((HistoryStats.decision == 'accepted', HistoryStats.requests), else_=0))
+    query = session.query(
+        HistoryStats.matched_course_id, UniversityCourse.title, requests.label('requests'),
+        accepted.label('accepted'), func.sum(HistoryStats.score_total).label('score_total')
+    ).outerjoin(UniversityCourse, UniversityCourse.id == HistoryStats.matched_course_id)
+    query = _in_range(query, date_from, date_to).group_by(HistoryStats.matched_course_id, UniversityCourse.title)
+    query = query.having(requests >= min_requests)
+    if order == 'acceptance':
+        query = query.order_by((accepted * 1.0 / requests).asc(), requests.desc())
+    else:
+        query = query.order_by(requests.desc())
+    return [{
+        'course_id': course_id or None,
+        'title': title or ('No match' if not course_id else f'Deleted course #{course_id}'),
+        'requests': count,
+        'acceptance_rate': accepted_count / count * 100,
+        'avg_score': score_total / count
+    } for course_id, title, count, accepted_count, score_total in query.limit(limit)]
+
+def score_distribution(session, date_from=None, date_to=None):
+    """Requests per 10-point score bucket, all ten buckets present."""
+    query = session.query(HistoryStats.score_bucket, func.sum(HistoryStats.requests)).group_by(HistoryStats.score_bucket)
+    counts = dict(_in_range(query, date_from, date_to).all())
+    return [{'label': f"{b * 10}-{b * 10 + 10}%", 'requests': counts.get(b, 0)} for b in range(10)]
+
+def daily_volume(session, date_from=None, date_to=None, days=30):
+    """Requests and decisions per day, most recent `days` days with activity, oldest first."""
+    query = session.query(
+        HistoryStats.day,
+        func.sum(HistoryStats.requests),
+        func.sum(case((HistoryStats.decision == 'accepted', HistoryStats.requests), else_=0)),
+        func.sum(case((HistoryStats.decision == 'partial', HistoryStats.requests), else_=0)),
+        func.sum(case((HistoryStats.decision == 'rejected', HistoryStats.requests), else_=0))
+    ).group_by(HistoryStats.day)
+    rows = _in_range(query, date_from, date_to).order_by(HistoryStats.day.desc()).limit(days).all()
+    return [
+        {'day': day, 'requests': count, 'accepted': accepted, 'partial': partial, 'rejected': rejected}
+        for day, count, accepted, partial, rejected in reversed(rows)
+    ]
@@ -1,14 +1,26 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
+from flask import Flask, Request, Response, g, render_template, request, redirect, url_for, flash, send_file, jsonify, abort
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from models import Session, User, University, UniversityCourse, Plan, ComparisonHistory
-from ai_comparator import compute_equivalency, compute_plan_equivalency
-from datetime import datetime
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from werkzeug.utils import secure_filename
+from models import Session, ReadSession, rebuild_history_stats, User, University, UniversityCourse, Plan, ComparisonHistory, PlanJob, Feedback, summarize_input_data
+from ai_comparator import search_equivalents, search_batch, compute_group_equivalency, compute_plan_equivalency, SET_POOLING
+from embedding_store import refresh_course_embeddings, get_catalog_index, index_version, catalog_courses, get_catalog_embeddings
+from result_cache import cached_search, cached_search_many
+import user_cache
+from jobs import submit_plan_job, expire_stale_jobs
+from startup import is_ready, phases
+from plan_upload import parse_plan_upload, normalize_plan_rows, format_size, PlanUploadError
+from catalog_import import import_catalog_file
+from reports import report_data, get_report, stream_reports_zip
+import metrics
+import analytics
+from metrics import timed
+from datetime import datetime, timedelta
 from sqlalchemy.orm import joinedload
+from sqlalchemy import or_, and_, false
 import os
-import csv
+import io
+from types import SimpleNamespace
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
 import json  # Add if missing (for parsing input_data)
 import logging
 
@@ -18,16 +30,35 @@ logging.info("App starting - Imports complete")
 
 # Safe config import with fallback
 try:
-    from config import SECRET_KEY, UPLOAD_FOLDER, ALLOWED_EXTENSIONS
+    from config import (SECRET_KEY, UPLOAD_FOLDER, ALLOWED_EXTENSIONS, TOP_K, SLOW_REQUEST_MS, ADMIN_PAGE_SIZE,
+                        MAX_UPLOAD_BYTES, MAX_PLAN_ROWS, MAX_CATALOG_BYTES, CATALOG_IMPORT_BATCH,
+                        REPORT_CACHE_SIZE, REPORT_WORKERS, API_MAX_K)
 except ImportError as e:
     logging.warning(f"Config import error: {e}")
     SECRET_KEY = os.urandom(24).hex()
     UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'csv', 'json'}
+    TOP_K = 5
+    SLOW_REQUEST_MS = 0
+    ADMIN_PAGE_SIZE = 50
+    MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+    MAX_PLAN_ROWS = 500
+    MAX_CATALOG_BYTES = 50 * 1024 * 1024
+    CATALOG_IMPORT_BATCH = 1000
+    REPORT_CACHE_SIZE = 256
+    REPORT_WORKERS = 2
+    API_MAX_K = 50
+
+class InMemoryUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Request bodies are capped by MAX_CONTENT_LENGTH, so keep uploads in memory instead of spooling to disk
+        return io.BytesIO()
 
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
 app.secret_key = SECRET_KEY
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024  # File plus form fields
 
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
@@ -35,25 +66,133 @@ login_manager.login_view = 'login'
 class FlaskUser(UserMixin):
     pass
 
+def db_session():
+    """The request's Session: opened on first use, closed (uncommitted work rolled back) at teardown."""
+    if 'db_session' not in g:
+        g.db_session = Session()
+    return g.db_session
+
+def read_session():
+    """Session for read-only admin listings; on the DATABASE_READ_URI replica when one is configured."""
+    if 'read_session' not in g:
+        g.read_session = ReadSession()
+    return g.read_session
+
+@app.teardown_appcontext
+def close_sessions(exc):
+    for name in ('db_session', 'read_session'):
+        session = g.pop(name, None)
+        if session is not None:
+            session.close()
+
 @login_manager.user_loader
 def load_user(user_id):
-    session = Session()
-    user = session.query(User).get(int(user_id))
-    session.close()
-    if user:
-        flask_user = FlaskUser()
-        flask_user.id = user.id
-        flask_user.role = user.role
-        return flask_user
-    return None
+    # Role comes from a short-lived in-process cache (students only), not a query per request
+    role = user_cache.get_role(int(user_id))
+    if role is None:
+        return None
+    flask_user = FlaskUser()
+    flask_user.id = int(user_id)
+    flask_user.role = role
+    return flask_user
+
+@login_manager.unauthorized_handler
+def unauthorized():
+    # API clients get a 401 instead of the login page
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'Login required'}), 401
+    flash(login_manager.login_message)
+    return redirect(url_for(login_manager.login_view, next=request.path))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def catalog_filters(session, form):
+    """Target catalog for a comparison: Dhofar University unless the form picks another, plus optional filters."""
+    university_id = form.get('university_id', type=int)
+    if university_id is None:
+        university_id = session.query(University.id).filter_by(name='Dhofar University').scalar()
+    return {
+        'university_id': university_id,
+        'department': form.get('department') or None,
+        'language': form.get('language') or None
+    }
+
+def resolve_candidates(session, hits):
+    """Load the courses behind index hits; returns (best course, best score, [(course, score), ...])."""
+    if not hits:
+        return None, 0.0, []
+    courses = {c.id: c for c in session.query(UniversityCourse).filter(UniversityCourse.id.in_([course_id for course_id, _ in hits]))}
+    ranked = [(courses[course_id], score) for course_id, score in hits if course_id in courses]
+    if not ranked:
+        return None, 0.0, []
+    return ranked[0][0], ranked[0][1], ranked
+
+def match_department_groups(session, descs, credits, pooling, filters):
+    """
+    Many-to-many set match: the pooled input set against every department of
+    the target catalog, each department pooled the same way.
+    Returns (best group, best score, [(group, score), ...]) like resolve_candidates.
+    """
+    with timed('catalog_query'):
+        courses = catalog_courses(session, **filters)
+        if not courses:
+            return None, 0.0, []
+        embeddings = get_catalog_embeddings(session, courses)
+    departments = {}
+    for row, course in enumerate(courses):
+        departments.setdefault(course.department or 'General', []).append(row)
+    names = list(departments)
+    hits = compute_group_equivalency(descs, [departments[name] for name in names], embeddings, pooling=pooling,
+                                     weights=credits, course_weights=[course.credits or 0 for course in courses], k=TOP_K)
+    ranked = []
+    for i, score in hits:
+        rows = departments[names[i]]
+        group = SimpleNamespace(id=None, title=f"{names[i]} ({len(rows)} courses)", credits=sum(courses[r].credits or 0 for r in rows))
+        ranked.append((group, score))
+    if not ranked:
+        return None, 0.0, []
+    return ranked[0][0], ranked[0][1], ranked
+
+@app.before_request
+def start_timing():
+    metrics.start_request()
+
+@app.after_request
+def record_timing(response):
+    total, breakdown = metrics.finish_request()
+    endpoint = request.endpoint or 'unknown'
+    metrics.observe('equiv_http_request_seconds', total, endpoint=endpoint)
+    metrics.inc('equiv_http_requests_total', endpoint=endpoint, status=response.status_code)
+    if SLOW_REQUEST_MS and total * 1000 >= SLOW_REQUEST_MS:
+        stages = ', '.join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in sorted(breakdown.items(), key=lambda kv: -kv[1]))
+        logging.warning(f"Slow request {request.method} {request.path}: {total * 1000:.1f}ms ({stages or 'no stages recorded'})")
+    return response
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    # Answer in the form the caller came from: JSON for the API, back to the page the form was on otherwise
+    if request.path.startswith('/api/'):
+        return jsonify({'error': f'Request too large (limit {format_size(MAX_UPLOAD_BYTES)})'}), 413
+    if request.endpoint == 'import_catalog_upload':
+        flash(f'Catalog file too large (limit {format_size(MAX_CATALOG_BYTES)})')
+        return redirect(url_for('admin_page'))
+    flash(f'Upload too large (limit {format_size(MAX_UPLOAD_BYTES)})')
+    return redirect(url_for('student_input'))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/health')
 def health():
     return "OK", 200  
 
+@app.route('/ready')
+def ready():
+    """Readiness (vs. /health liveness): 503 until models are loaded and warmed up."""
+    return jsonify({'ready': is_ready(), 'phases': phases}), 200 if is_ready() else 503
+
 @app.route('/')
 def index():
     return render_template('home.html')
@@ -61,15 +200,14 @@ def index():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        session = Session()
         username = request.form['username']
         password = request.form['password']
-        user = session.query(User).filter_by(username=username).first()
-        session.close()
+        user = db_session().query(User).filter_by(username=username).first()
         if user and user.check_password(password):
             flask_user = FlaskUser()
             flask_user.id = user.id
             flask_user.role = user.role
+            user_cache.remember(user.id, user.role)
             login_user(flask_user)
             if user.role == 'admin':
                 return redirect(url_for('admin_page'))
@@ -86,7 +224,7 @@ def logout():
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
-        session = Session()
+        session = db_session()
         username = request.form['username']
         password = request.form['password']
         role = 'student'  # Default to student (admin via separate route)
@@ -99,7 +237,6 @@ def register():
             session.add(new_user)
             session.commit()
             flash('Registered as student! Login now.')
-        session.close()
         return redirect(url_for('login'))
     return render_template('register.html')  
 
@@ -114,7 +251,7 @@ def student_input():
 @login_required
 def feedback():
     if request.method == 'POST':
-        session = Session()
+        session = db_session()
         # Safe Feedback import/add (handle if model missing)
         try:
             from models import Feedback
@@ -127,7 +264,6 @@ def feedback():
             flash('Feedback submitted! Thank you.')
         except ImportError:
             flash('Feedback feature not available yet.')
-        session.close()
         return redirect(url_for('student_input'))  
     return render_template('feedback.html')
 
@@ -136,16 +272,23 @@ def feedback():
 def compare():
     if current_user.role != 'student':
         return redirect(url_for('index'))
-    session = Session()
+    session = db_session()
     try:
         compare_type = request.form.get('compare_type', 'single')  
-        dhofar_courses = session.query(UniversityCourse).filter(UniversityCourse.university.has(name='Dhofar University')).all()
+        with timed('catalog_query'):
+            filters = catalog_filters(session, request.form)
+        candidates = []
 
         if compare_type == 'single':
             input_title = request.form['title']
             input_desc = request.form['description']
             input_credits = int(request.form['credits'])
-            matched, score = compute_equivalency([input_desc], dhofar_courses)
+            with timed('catalog_query'):
+                catalog_index = get_catalog_index(session)
+            hits = cached_search('single', [input_desc], filters, TOP_K, index_version(),
+                                 lambda: search_equivalents([input_desc], catalog_index, k=TOP_K, **filters))
+            with timed('catalog_query'):
+                matched, score, candidates = resolve_candidates(session, hits)
             input_dict = {'title': input_title, 'desc': input_desc, 'credits': input_credits}  # Dict for easy render
             decision = 'accepted' if score >= 80 else 'partial' if score >= 50 else 'rejected'
 
@@ -153,7 +296,21 @@ def compare():
             titles = request.form.getlist('titles[]')
             descs = request.form.getlist('descs[]')
             credits = request.form.getlist('credits[]')
-            matched, score = compute_equivalency(descs, dhofar_courses, is_set=True)
+            pooling = request.form.get('pooling', 'mean')
+            if pooling not in SET_POOLING:
+                pooling = 'mean'
+            if request.form.get('set_target') == 'departments':
+                matched, score, candidates = match_department_groups(session, descs, credits, pooling, filters)
+            else:
+                with timed('catalog_query'):
+                    catalog_index = get_catalog_index(session)
+                # Pooling and (for credit weighting) the credits change the result, so they are part of the key
+                key_filters = dict(filters, pooling=pooling, credits=credits if pooling == 'credits' else None)
+                hits = cached_search('set', descs, key_filters, TOP_K, index_version(),
+                                     lambda: search_equivalents(descs, catalog_index, is_set=True, k=TOP_K, pooling=pooling,
+                                                                weights=credits, **filters))
+                with timed('catalog_query'):
+                    matched, score, candidates = resolve_candidates(session, hits)
             input_dict = [{'title': t, 'desc': d, 'credits': c} for t, d, c in zip(titles, descs, credits)]
             decision = 'accepted' if score >= 80 else 'partial' if score >= 50 else 'rejected'
 
@@ -162,23 +319,19 @@ def compare():
                 flash('No file')
                 return redirect(url_for('student_input'))
             file = request.files['file']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                input_plan = []
-                if filename.endswith('.csv'):
-                    with open(filepath, 'r') as f:
-                        reader = csv.DictReader(f)
-                        for row in reader:
-                            input_plan.append({'title': row['title'], 'description': row['description'], 'credits': row['credits']})
-                elif filename.endswith('.json'):
-                    with open(filepath, 'r') as f:
-                        input_plan = json.load(f)
-                os.remove(filepath)  # Cleanup
-                results, overall_score = compute_plan_equivalency(input_plan, dhofar_courses)
-                decision = 'accepted' if overall_score >= 80 else 'partial' if overall_score >= 50 else 'rejected'
-                return render_template('results.html', results=results, overall_score=overall_score, compare_type='plan')
+            if not (file and allowed_file(file.filename)):
+                flash('Plan must be a CSV or JSON file')
+                return redirect(url_for('student_input'))
+            # Parsed row by row from the in-memory upload; nothing touches UPLOAD_FOLDER
+            try:
+                input_plan = parse_plan_upload(file, MAX_UPLOAD_BYTES, MAX_PLAN_ROWS)
+            except PlanUploadError as e:
+                flash(f'Invalid plan: {e}')
+                return redirect(url_for('student_input'))
+            one_to_one = request.form.get('one_to_one') == 'on'  # Each DU course matched at most once
+            # Scored in the background; the job page polls for results
+            job_id = submit_plan_job(current_user.id, input_plan, filters, one_to_one=one_to_one)
+            return redirect(url_for('plan_job', job_id=job_id))
 
         history = ComparisonHistory(
             user_id=current_user.id,
@@ -187,81 +340,297 @@ def compare():
             matched_course_id=matched.id if matched else None,
             decision=decision
         )
-        session.add(history)
-        session.commit()
+        with timed('history_insert'):
+            session.add(history)
+            session.commit()
 
-        return render_template('results.html', 
-                               match_title=matched.title if matched else 'None',
-                               match_credits=matched.credits if matched else 0,
-                               score=score,
-                               input_data=input_dict,  # Pass parsed dict for Arabic
-                               decision=decision,
-                               compare_type=compare_type)
+        with timed('render'):
+            return render_template('results.html', 
+                                   match_title=matched.title if matched else 'None',
+                                   match_credits=matched.credits if matched else 0,
+                                   score=score,
+                                   input_data=input_dict,  # Pass parsed dict for Arabic
+                                   decision=decision,
+                                   candidates=candidates,
+                                   compare_type=compare_type)
     except Exception as e:
         flash(f'Error: {str(e)}')
         return redirect(url_for('student_input'))
-    finally:
-        session.close()
+
+def load_job(session, job_id):
+    job = session.get(PlanJob, job_id)
+    if not job or (job.user_id != current_user.id and current_user.role != 'admin'):
+        abort(404)
+    if job.status in ('queued', 'running') and expire_stale_jobs(session, job_id):
+        session.refresh(job)
+    return job
+
+@app.route('/jobs/<job_id>')
+@login_required
+def plan_job(job_id):
+    job = load_job(db_session(), job_id)
+    return render_template('job.html', job=job, results=json.loads(job.results or '[]'))
+
+@app.route('/jobs/<job_id>/status')
+@login_required
+def plan_job_status(job_id):
+    """Job progress as JSON; results[since:] lets the page fetch only rows it hasn't shown yet."""
+    job = load_job(db_session(), job_id)
+    since = request.args.get('since', 0, type=int)
+    return jsonify({
+        'status': job.status,
+        'completed': job.completed,
+        'total': job.total,
+        'overall_score': job.overall_score,
+        'decision': job.decision,
+        'error': job.error,
+        'results': json.loads(job.results or '[]')[since:]
+    })
+
+def course_json(course):
+    return {'course_id': course.id, 'title': course.title, 'credits': course.credits, 'department': course.department}
+
+def api_result(input_data, matched, score, ranked):
+    return {
+        'input': input_data,
+        'matched': course_json(matched) if matched else None,
+        'score': score,
+        'decision': 'accepted' if score >= 80 else 'partial' if score >= 50 else 'rejected',
+        'candidates': [dict(course_json(course), score=course_score) for course, course_score in ranked]
+    }
+
+@app.route('/api/compare', methods=['POST'])
+@login_required
+def api_compare():
+    """
+    JSON batch comparison, no template rendering. Body:
+        {"compare_type": "single" | "set" | "plan",
+         "courses": [{"title", "description", "credits"}, ...],
+         "k", "university_id", "department", "language",
+         "pooling" (set only), "one_to_one" (plan only)}
+    single: the top-k candidates of every course, one matrix search for all.
+    set: the top-k candidates of the pooled set (one result).
+    plan: per course the top-k candidates plus its match in the plan
+    assignment, and the overall score and decision.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    compare_type = payload.get('compare_type', 'single')
+    if compare_type not in ('single', 'set', 'plan'):
+        return jsonify({'error': f'Unknown compare_type: {compare_type}'}), 400
+    try:
+        courses = normalize_plan_rows(payload.get('courses'), MAX_PLAN_ROWS)
+        k = max(1, min(int(payload.get('k', TOP_K)), API_MAX_K))
+    except PlanUploadError as e:
+        return jsonify({'error': f'Invalid courses: {e}'}), 400
+    except (TypeError, ValueError):
+        return jsonify({'error': 'k must be an integer'}), 400
+
+    session = db_session()
+    university_id = payload.get('university_id')
+    if university_id is not None:
+        # catalog_filters falls back to Dhofar for anything it can't read; an API caller should hear about it
+        try:
+            if isinstance(university_id, bool) or not isinstance(university_id, (int, str)):
+                raise ValueError
+            university_id = int(university_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'university_id must be an integer'}), 400
+        if session.get(University, university_id) is None:
+            return jsonify({'error': f'Unknown university_id: {university_id}'}), 400
+    try:
+        with timed('catalog_query'):
+            form = MultiDict({key: payload[key] for key in ('university_id', 'department', 'language') if payload.get(key) is not None})
+            filters = catalog_filters(session, form)
+        descs = [course['description'] for course in courses]
+        credits = [course['credits'] for course in courses]
+        inputs = [{'title': course['title'], 'credits': course['credits']} for course in courses]
+        response = {'compare_type': compare_type, 'k': k}
+
+        if compare_type == 'plan':
+            with timed('catalog_query'):
+                catalog = catalog_courses(session, **filters)
+                embeddings = get_catalog_embeddings(session, catalog)
+            results, overall_score = compute_plan_equivalency(courses, catalog, dhofar_embeddings=embeddings,
+                                                              one_to_one=bool(payload.get('one_to_one')), k=k)
+            response['results'] = [api_result(input_data, r['matched'], r['score'], r['candidates'])
+                                   for input_data, r in zip(inputs, results)]
+            response['overall_score'] = overall_score
+            response['decision'] = 'accepted' if overall_score >= 80 else 'partial' if overall_score >= 50 else 'rejected'
+            return jsonify(response)
+
+        with timed('catalog_query'):
+            catalog_index = get_catalog_index(session)
+        if compare_type == 'set':
+            pooling = payload.get('pooling', 'mean')
+            if pooling not in SET_POOLING:
+                return jsonify({'error': f'Unknown pooling: {pooling}'}), 400
+            key_filters = dict(filters, pooling=pooling, credits=[str(c) for c in credits] if pooling == 'credits' else None)
+            hit_lists = [cached_search('set', descs, key_filters, k, index_version(),
+                                       lambda: search_equivalents(descs, catalog_index, is_set=True, k=k, pooling=pooling,
+                                                                  weights=credits, **filters))]
+            inputs = [inputs]
+        else:
+            hit_lists = cached_search_many('single', [[desc] for desc in descs], filters, k, index_version(),
+                                           lambda missing: search_batch([q[0] for q in missing], catalog_index, k=k, **filters))
+
+        with timed('catalog_query'):
+            ids = {course_id for hits in hit_lists for course_id, _ in hits}
+            found = {c.id: c for c in session.query(UniversityCourse).filter(UniversityCourse.id.in_(ids))} if ids else {}
+        response['results'] = []
+        for input_data, hits in zip(inputs, hit_lists):
+            ranked = [(found[course_id], score) for course_id, score in hits if course_id in found]
+            matched, score = ranked[0] if ranked else (None, 0.0)
+            response['results'].append(api_result(input_data, matched, score, ranked))
+        return jsonify(response)
+    except Exception as e:
+        logging.exception("API comparison failed")
+        return jsonify({'error': str(e)}), 500
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+def parse_history_cursor(value):
+    """(timestamp, id) from an activity log cursor ("<isoformat>_<id>"), or None if it doesn't parse."""
+    try:
+        cursor_ts, _, cursor_id = value.rpartition('_')
+        return datetime.fromisoformat(cursor_ts), int(cursor_id)
+    except ValueError:
+        return None
+
+def filter_history(session, args):
+    """ComparisonHistory query narrowed by the activity log filters (decision, user, matched university, dates)."""
+    query = session.query(ComparisonHistory).options(joinedload(ComparisonHistory.user))
+    if args.get('decision'):
+        query = query.filter(ComparisonHistory.decision == args['decision'])
+    if args.get('user'):
+        user_id = session.query(User.id).filter_by(username=args['user']).scalar()
+        # An unknown username matches nothing (not the rows without a user)
+        query = query.filter(ComparisonHistory.user_id == user_id if user_id is not None else false())
+    history_university = args.get('history_university', type=int)
+    if history_university:
+        query = query.filter(ComparisonHistory.matched_course.has(UniversityCourse.university_id == history_university))
+    date_from = parse_date(args.get('date_from'))
+    if date_from:
+        query = query.filter(ComparisonHistory.timestamp >= date_from)
+    date_to = parse_date(args.get('date_to'))
+    if date_to:
+        query = query.filter(ComparisonHistory.timestamp < date_to + timedelta(days=1))
+    return query
 
 @app.route('/admin')
 @login_required
 def admin_page():
+    """
+    Admin dashboard. Each table is keyset-paginated (ADMIN_PAGE_SIZE rows,
+    cursor = last key seen) so a page costs the same however large the
+    tables grow; the activity log can be filtered by date, decision, user
+    and matched university.
+    """
     if current_user.role != 'admin':
         return redirect(url_for('index'))
-    session = Session()
-    
-    courses = session.query(UniversityCourse).options(joinedload(UniversityCourse.university)).all()
-    plans = session.query(Plan).options(joinedload(Plan.university)).all()
-    history = session.query(ComparisonHistory).options(
-        joinedload(ComparisonHistory.user),
-        joinedload(ComparisonHistory.matched_course)
-    ).all()
-    universities = session.query(University).all()
-    # Safe Feedback (if model exists)
-    try:
-        from models import Feedback
-        feedbacks = session.query(Feedback).options(joinedload(Feedback.user)).all() 
-    except ImportError:
-        feedbacks = []
-        logging.warning("Feedback model not found")
-    session.close()
-
-    def format_input_data(input_str):
-        if not input_str:
-            return "No data"
-        try:
-            data = json.loads(input_str)
-            if isinstance(data, dict):  # Single course
-                return f"Title: {data['title']} - Desc: {data['desc'][:50]}... ({data['credits']} credits)"
-            elif isinstance(data, list):  # Set or plan
-                return [f"Title: {item['title']} - Desc: {item['desc'][:50]}... ({item['credits']} credits)" for item in data]
-            return input_str  # Fallback
-        except json.JSONDecodeError:
-            return "Invalid data"
-
-    formatted_history = []
-    for hist in history:
-        formatted_input = format_input_data(hist.input_data)
-        formatted_history.append({
-            'id': hist.id,
-            'user': hist.user.username if hist.user else 'Anon',
-            'input_data': formatted_input,  
-            'equivalency_score': hist.equivalency_score,
-            'decision': hist.decision,
-            'timestamp': hist.timestamp
-        })
-
-    return render_template('admin.html', courses=courses, plans=plans, history=formatted_history, universities=universities, feedbacks=feedbacks)
+    args = request.args
+    session = read_session()
+    universities = session.query(University).order_by(University.name).all()
+
+    # Courses: ascending id, optional university filter
+    course_query = session.query(UniversityCourse).options(joinedload(UniversityCourse.university))
+    course_university = args.get('course_university', type=int)
+    if course_university:
+        course_query = course_query.filter(UniversityCourse.university_id == course_university)
+    courses_after = args.get('courses_after', type=int)
+    if courses_after:
+        course_query = course_query.filter(UniversityCourse.id > courses_after)
+    courses = course_query.order_by(UniversityCourse.id).limit(ADMIN_PAGE_SIZE + 1).all()
+    courses_next = courses[ADMIN_PAGE_SIZE - 1].id if len(courses) > ADMIN_PAGE_SIZE else None
+    courses = courses[:ADMIN_PAGE_SIZE]
+
+    plan_query = session.query(Plan).options(joinedload(Plan.university))
+    plans_after = args.get('plans_after', type=int)
+    if plans_after:
+        plan_query = plan_query.filter(Plan.id > plans_after)
+    plans = plan_query.order_by(Plan.id).limit(ADMIN_PAGE_SIZE + 1).all()
+    plans_next = plans[ADMIN_PAGE_SIZE - 1].id if len(plans) > ADMIN_PAGE_SIZE else None
+    plans = plans[:ADMIN_PAGE_SIZE]
+
+    # Activity log: newest first on the (timestamp, id) key
+    history_query = filter_history(session, args)
+    cursor = parse_history_cursor(args['history_cursor']) if args.get('history_cursor') else None
+    if cursor:  # An invalid cursor shows the first page
+        cursor_ts, cursor_id = cursor
+        history_query = history_query.filter(or_(
+            ComparisonHistory.timestamp < cursor_ts,
+            and_(ComparisonHistory.timestamp == cursor_ts, ComparisonHistory.id < cursor_id)
+        ))
+    history_rows = history_query.order_by(ComparisonHistory.timestamp.desc(), ComparisonHistory.id.desc()).limit(ADMIN_PAGE_SIZE + 1).all()
+    history_next = None
+    if len(history_rows) > ADMIN_PAGE_SIZE:
+        last = history_rows[ADMIN_PAGE_SIZE - 1]
+        history_next = f"{last.timestamp.isoformat()}_{last.id}"
+    history = [{
+        'id': hist.id,
+        'user': hist.user.username if hist.user else 'Anon',
+        # Precomputed on insert; rows written before the column existed fall back to parsing
+        'input_data': hist.input_summary or summarize_input_data(hist.input_data),
+        'equivalency_score': hist.equivalency_score,
+        'decision': hist.decision,
+        'timestamp': hist.timestamp
+    } for hist in history_rows[:ADMIN_PAGE_SIZE]]
+
+    feedback_query = session.query(Feedback).options(joinedload(Feedback.user))
+    feedback_before = args.get('feedback_before', type=int)
+    if feedback_before:
+        feedback_query = feedback_query.filter(Feedback.id < feedback_before)
+    feedbacks = feedback_query.order_by(Feedback.id.desc()).limit(ADMIN_PAGE_SIZE + 1).all()
+    feedback_next = feedbacks[ADMIN_PAGE_SIZE - 1].id if len(feedbacks) > ADMIN_PAGE_SIZE else None
+    feedbacks = feedbacks[:ADMIN_PAGE_SIZE]
+
+    def page_url(**changes):
+        params = args.to_dict()
+        params.update(changes)
+        return url_for('admin_page', **{k: v for k, v in params.items() if v not in (None, '')})
+
+    export_filters = {k: args[k] for k in ('decision', 'user', 'history_university', 'date_from', 'date_to') if args.get(k)}
+    return render_template(
+        'admin.html', courses=courses, plans=plans, history=history, universities=universities,
+        feedbacks=feedbacks, filters=args, page_url=page_url, export_url=url_for('export_reports', **export_filters),
+        courses_next=courses_next, plans_next=plans_next, history_next=history_next, feedback_next=feedback_next
+    )
+
+@app.route('/admin/analytics')
+@login_required
+def analytics_page():
+    """Decision analytics from the pre-aggregated history_stats table (constant cost in history size)."""
+    if current_user.role != 'admin':
+        return redirect(url_for('index'))
+    session = read_session()
+    date_from = parse_date(request.args.get('date_from'))
+    date_to = parse_date(request.args.get('date_to'))
+    date_from = date_from.date() if date_from else None
+    date_to = date_to.date() if date_to else None
+    min_requests = 5
+    return render_template(
+        'analytics.html', filters=request.args, min_requests=min_requests,
+        totals=analytics.totals(session, date_from, date_to),
+        daily=analytics.daily_volume(session, date_from, date_to),
+        distribution=analytics.score_distribution(session, date_from, date_to),
+        top_courses=analytics.course_stats(session, date_from, date_to),
+        low_acceptance=analytics.course_stats(session, date_from, date_to, min_requests=min_requests, order='acceptance')
+    )
 
 @app.route('/admin/clear_history', methods=['POST'])
 @login_required
 def clear_history():
     if current_user.role != 'admin':
         return redirect(url_for('index'))
-    session = Session()
+    session = db_session()
     session.query(ComparisonHistory).delete()  # Delete all
+    rebuild_history_stats(session.connection())  # Bulk deletes skip the per-row summary updates
     session.commit()
-    session.close()
     flash('History cleared successfully!')
     return redirect(url_for('admin_page'))
 
@@ -271,7 +640,7 @@ def create_admin():
     if current_user.role != 'admin':
         return redirect(url_for('index'))
     if request.method == 'POST':
-        session = Session()
+        session = db_session()
         username = request.form['username']
         password = request.form['password']
         existing = session.query(User).filter_by(username=username).first()
@@ -283,7 +652,6 @@ def create_admin():
             session.add(new_user)
             session.commit()
             flash('Admin created successfully!')
-        session.close()
         return redirect(url_for('admin_page'))
     return render_template('create_admin.html')  
 
@@ -292,7 +660,7 @@ def create_admin():
 def add_course():
     if current_user.role != 'admin':
         return redirect(url_for('index'))
-    session = Session()
+    session = db_session()
     try:
         uni_id = int(request.form['university_id'])  
         new_course = UniversityCourse(
@@ -305,11 +673,38 @@ def add_course():
         )
         session.add(new_course)
         session.commit()
+        try:
+            refresh_course_embeddings(session, [new_course])
+        except Exception as e:
+            # Course is saved; its embedding will be computed on the next compare
+            logging.warning(f"Embedding refresh failed for course {new_course.id}: {e}")
         flash('Course added!')
     except Exception as e:
         flash(f'Error: {str(e)}')
-    finally:
-        session.close()
+    return redirect(url_for('admin_page'))
+
+@app.route('/admin/import_catalog', methods=['POST'])
+@login_required
+def import_catalog_upload():
+    if current_user.role != 'admin':
+        return redirect(url_for('index'))
+    # Catalogs are much larger than plan uploads; raise the limit before the form is parsed
+    request.max_content_length = MAX_CATALOG_BYTES + 64 * 1024
+    session = db_session()
+    try:
+        uni_id = int(request.form['university_id'])
+        file = request.files.get('file')
+        if not file or not allowed_file(file.filename):
+            flash('Catalog must be a CSV or JSON file')
+            return redirect(url_for('admin_page'))
+        stats = import_catalog_file(session, uni_id, file.stream, file.filename,
+                                    max_bytes=MAX_CATALOG_BYTES, batch_size=CATALOG_IMPORT_BATCH)
+        flash(f"Imported {stats['inserted']} new and {stats['updated']} updated courses "
+              f"in {stats['seconds']:.1f}s ({stats['rows_per_sec']:.0f} rows/sec)")
+    except HTTPException:
+        raise  # e.g. 413 from reading the form: upload_too_large answers it
+    except Exception as e:
+        flash(f'Import failed: {str(e)}')
     return redirect(url_for('admin_page'))
 
 @app.route('/add_plan', methods=['POST'])
@@ -317,7 +712,7 @@ def add_course():
 def add_plan():
     if current_user.role != 'admin':
         return redirect(url_for('index'))
-    session = Session()
+    session = db_session()
     try:
         uni_id = int(request.form['university_id'])
         new_plan = Plan(
@@ -329,8 +724,6 @@ def add_plan():
         flash('Plan added!')
     except Exception as e:
         flash(f'Error: {str(e)}')
-    finally:
-        session.close()
     return redirect(url_for('admin_page'))
 
 @app.route('/add_university', methods=['POST'])
@@ -338,7 +731,7 @@ def add_plan():
 def add_university():
     if current_user.role != 'admin':
         return redirect(url_for('index'))
-    session = Session()
+    session = db_session()
     try:
         new_uni = University(name=request.form['name'])
         session.add(new_uni)
@@ -346,8 +739,6 @@ def add_university():
         flash('University added!')
     except Exception as e:
         flash(f'Error: {str(e)}')
-    finally:
-        session.close()
     return redirect(url_for('admin_page'))
 
 @app.route('/generate_report/<int:history_id>')
@@ -355,32 +746,40 @@ def add_university():
 def generate_report(history_id):
     if current_user.role != 'admin':
         return redirect(url_for('index'))
-    session = Session()
-    
-    history = session.query(ComparisonHistory).options(
-        joinedload(ComparisonHistory.user),
-        joinedload(ComparisonHistory.matched_course)  
-    ).get(history_id)
-    session.close()
+    history = read_session().query(ComparisonHistory).options(joinedload(ComparisonHistory.user)).get(history_id)
     if not history:
         flash('No history')
         return redirect(url_for('admin_page'))
 
-    pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], f'report_{history_id}.pdf')
-    c = canvas.Canvas(pdf_path, pagesize=letter)
-    c.drawString(100, 750, "Dhofar University Equivalency Report")
-    c.drawString(100, 730, f"User: {history.user.username}")
-    c.drawString(100, 710, f"Input: {history.input_data[:100]}...")  # Truncate
-    c.drawString(100, 690, f"Score: {history.equivalency_score:.1f}%")
-    c.drawString(100, 670, f"Decision: {history.decision}")
-    c.drawString(100, 650, f"Date: {history.timestamp}")
-    c.save()
+    with timed('report_render'):
+        pdf = get_report(report_data(history), max_entries=REPORT_CACHE_SIZE)
+    return send_file(io.BytesIO(pdf), mimetype='application/pdf', as_attachment=True, download_name=f'report_{history_id}.pdf')
 
-    return send_file(pdf_path, as_attachment=True)
-    
+@app.route('/admin/export_reports')
+@login_required
+def export_reports():
+    """ZIP of the PDF reports for every activity log row matching the admin filters, streamed as it is built."""
+    if current_user.role != 'admin':
+        return redirect(url_for('index'))
+    session = read_session()
+    rows = [report_data(hist) for hist in filter_history(session, request.args).order_by(ComparisonHistory.id)]
+    session.close()  # Rows are plain dicts; don't hold a connection while the ZIP streams
+    if not rows:
+        flash('No history matches these filters')
+        return redirect(url_for('admin_page', **request.args))
+
+    logging.info(f"Exporting {len(rows)} reports")
+    return Response(
+        stream_reports_zip(rows, workers=REPORT_WORKERS, max_entries=REPORT_CACHE_SIZE),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=reports_{datetime.now():%Y%m%d_%H%M%S}.zip'}
+    )
 
 import os  
 
 if __name__ == '__main__':
+    import startup
+    startup.preload(fork=False)
+    startup.warm_up()
     port = int(os.environ.get('PORT', 5000))  
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
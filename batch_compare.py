@@ -0,0 +1,219 @@
+"""
+Offline batch plan comparisons for registrar backlogs.
+
+Every CSV/JSON transcript in a directory (same format as the /compare plan
+upload) is scored with compute_plan_equivalency across a pool of worker
+processes. Each worker loads the model and the catalog embeddings once and
+then takes files one at a time. For every student the output directory gets
+<file>.results.csv and/or <file>.results.json, and summary.csv lists the
+overall score and decision per file.
+
+Finished files are appended to manifest.jsonl together with a hash of their
+contents, so an interrupted run picks up where it stopped: files already done
+and unchanged are skipped, failed or edited ones are run again (--restart
+ignores the manifest).
+
+    python batch_compare.py transcripts/ --output results/ --workers 4
+    python batch_compare.py transcripts/ --output results/ --format both --history-user registrar
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from models import Session, ComparisonHistory, University, User
+
+RESULT_FIELDS = ['title', 'credits', 'matched_id', 'matched_title', 'matched_credits', 'score']
+SUMMARY_FIELDS = ['file', 'courses', 'overall_score', 'decision']
+
+# Per worker process: (catalog courses, their embeddings, one_to_one), set by _init_worker
+_worker_state = None
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _init_worker(filters, one_to_one):
+    global _worker_state
+    from ai_comparator import get_model
+    from embedding_store import catalog_courses, get_catalog_embeddings
+    get_model()
+    session = Session()
+    try:
+        courses = catalog_courses(session, **filters)
+        embeddings = get_catalog_embeddings(session, courses)
+    finally:
+        session.close()
+    _worker_state = (courses, embeddings, one_to_one)
+
+def compare_file(path):
+    """Score one transcript in a worker; returns a manifest entry plus the per-course results."""
+    from ai_comparator import compute_plan_equivalency
+    from jobs import serialize_result
+    from plan_upload import iter_upload_rows, PlanUploadError
+    courses, embeddings, one_to_one = _worker_state
+    entry = {'file': os.path.basename(path), 'sha1': _file_hash(path)}
+    try:
+        with open(path, 'rb') as f:
+            input_plan = list(iter_upload_rows(f, path, None))
+        if not input_plan:
+            raise PlanUploadError("Plan contains no courses")
+        results, _ = compute_plan_equivalency(input_plan, courses, dhofar_embeddings=embeddings, one_to_one=one_to_one)
+    except (PlanUploadError, csv.Error, UnicodeDecodeError, OSError) as e:
+        return dict(entry, status='failed', error=str(e)), None
+    results = [dict(serialize_result(r), description=r['input']['description']) for r in results]
+    overall_score = float(np.mean([r['score'] for r in results]))
+    decision = 'accepted' if overall_score >= 80 else 'partial' if overall_score >= 50 else 'rejected'
+    entry.update(status='done', courses=len(results), overall_score=overall_score, decision=decision)
+    return entry, results
+
+def read_manifest(output_dir):
+    """file name -> last manifest entry."""
+    entries = {}
+    path = os.path.join(output_dir, 'manifest.jsonl')
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn last line from an interrupted run
+                entries[entry['file']] = entry
+    return entries
+
+def write_results(output_dir, entry, results, formats):
+    base = os.path.join(output_dir, f"{entry['file']}.results")
+    if 'csv' in formats:
+        with open(f"{base}.csv", 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(results)
+    if 'json' in formats:
+        with open(f"{base}.json", 'w', encoding='utf-8') as f:
+            json.dump(dict(entry, results=results), f, ensure_ascii=False, indent=2)
+
+def record_history(session, user_id, results):
+    """One ComparisonHistory row per input course, committed together."""
+    session.add_all([
+        ComparisonHistory(
+            user_id=user_id,
+            input_data=json.dumps({'title': r['title'], 'desc': r['description'], 'credits': r['credits']}),
+            equivalency_score=r['score'],
+            matched_course_id=r['matched_id'],
+            decision='accepted' if r['score'] >= 80 else 'partial' if r['score'] >= 50 else 'rejected'
+        ) for r in results
+    ])
+    session.commit()
+
+def run_batch(input_dir, output_dir, filters, workers=1, one_to_one=False, formats=('csv',), history_user_id=None, restart=False):
+    """Score every transcript in input_dir; returns counts of done, failed and skipped files."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith(('.csv', '.json')) and os.path.isfile(os.path.join(input_dir, name))
+    )
+    manifest = {} if restart else read_manifest(output_dir)
+    pending = [
+        path for path in paths
+        if manifest.get(os.path.basename(path), {}).get('status') != 'done'
+        or manifest[os.path.basename(path)]['sha1'] != _file_hash(path)
+    ]
+    stats = {'done': 0, 'failed': 0, 'skipped': len(paths) - len(pending)}
+    logging.info(f"Batch compare: {len(pending)} file(s) to score, {stats['skipped']} already done")
+
+    # Encode missing catalog embeddings once here rather than in every worker
+    from embedding_store import catalog_courses, refresh_course_embeddings
+    session = Session()
+    try:
+        refresh_course_embeddings(session, catalog_courses(session, **filters))
+    finally:
+        session.close()
+
+    started = time.perf_counter()
+    session = Session() if history_user_id else None
+    pool = None
+    try:
+        if workers > 1 and len(pending) > 1:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_worker, initargs=(filters, one_to_one))
+            outcomes = (future.result() for future in as_completed([pool.submit(compare_file, path) for path in pending]))
+        else:
+            _init_worker(filters, one_to_one)
+            outcomes = map(compare_file, pending)
+
+        with open(os.path.join(output_dir, 'manifest.jsonl'), 'w' if restart else 'a', encoding='utf-8') as log:
+            for entry, results in outcomes:
+                if entry['status'] == 'done':
+                    write_results(output_dir, entry, results, formats)
+                    if session is not None:
+                        record_history(session, history_user_id, results)
+                    stats['done'] += 1
+                else:
+                    logging.warning(f"{entry['file']}: {entry['error']}")
+                    stats['failed'] += 1
+                # Only after outputs (and history) are written, so a crash means the file is redone
+                log.write(json.dumps(entry) + '\n')
+                log.flush()
+                manifest[entry['file']] = entry
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if session is not None:
+            session.close()
+
+    with open(os.path.join(output_dir, 'summary.csv'), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(entry for _, entry in sorted(manifest.items()) if entry['status'] == 'done')
+
+    stats['seconds'] = time.perf_counter() - started
+    logging.info(f"Batch compare: {stats['done']} done, {stats['failed']} failed in {stats['seconds']:.1f}s")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input_dir', help="directory of CSV/JSON transcripts")
+    parser.add_argument('--output', required=True, help="directory for results, summary.csv and manifest.jsonl")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1), help="worker processes")
+    parser.add_argument('--university', default='Dhofar University', help="catalog to match against")
+    parser.add_argument('--department', help="only match courses of this department")
+    parser.add_argument('--language', help="only match courses in this language")
+    parser.add_argument('--one-to-one', action='store_true', help="match each catalog course at most once per student")
+    parser.add_argument('--format', choices=['csv', 'json', 'both'], default='csv')
+    parser.add_argument('--history-user', help="record ComparisonHistory rows under this username")
+    parser.add_argument('--restart', action='store_true', help="ignore manifest.jsonl and score every file again")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir):
+        sys.exit(f"Not a directory: {args.input_dir}")
+    session = Session()
+    try:
+        university_id = session.query(University.id).filter_by(name=args.university).scalar()
+        if university_id is None:
+            sys.exit(f"No university named {args.university!r}")
+        history_user_id = None
+        if args.history_user:
+            history_user_id = session.query(User.id).filter_by(username=args.history_user).scalar()
+            if history_user_id is None:
+                sys.exit(f"No user named {args.history_user!r}")
+    finally:
+        session.close()
+
+    filters = {'university_id': university_id, 'department': args.department, 'language': args.language}
+    formats = ('csv', 'json') if args.format == 'both' else (args.format,)
+    stats = run_batch(args.input_dir, args.output, filters, workers=args.workers, one_to_one=args.one_to_one,
+                      formats=formats, history_user_id=history_user_id, restart=args.restart)
+    print(f"Scored {stats['done']} transcript(s), {stats['failed']} failed, {stats['skipped']} skipped "
+          f"(already done) in {stats['seconds']:.1f}s")
+
+if __name__ == '__main__':
+    main()
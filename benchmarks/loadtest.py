@@ -0,0 +1,314 @@
+"""
+End-to-end HTTP load test of the web app.
+
+Seeds a local SQLite database with a synthetic catalog (benchmarks.synthetic,
+imported through catalog_import), simulated student and admin accounts and
+some comparison history, serves the Flask app from a threaded werkzeug server
+in this process, and drives it over HTTP with concurrent simulated users.
+Each user logs in once, then picks weighted random actions until the run
+ends:
+    student  student_page, compare_single, compare_set, compare_plan, api_single, api_plan
+    admin    admin, admin_filtered, analytics
+Per action it reports requests/s, latency percentiles and the error rate; an
+error is an exception, an unexpected status or a compare that bounced back
+to the input page with a flashed error.
+
+    python -m benchmarks.loadtest --stub
+    python -m benchmarks.loadtest --stub --catalog 20000 --students 32 --admins 2 --duration 60
+    python -m benchmarks.loadtest --stub --student-mix compare_single=1,api_single=1 --output load.json
+
+--stub swaps in benchmarks.stub_encoder so no model weights are needed; the
+web layer, database and index still do their real work. Settings that
+config.py reads from the environment (RESULT_CACHE, VECTOR_INDEX_*, ...)
+apply as usual.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+import requests
+from benchmarks.synthetic import make_catalog, make_transcript, perturb
+
+PASSWORD = 'loadtest'
+STUDENT_MIX = 'student_page=1,compare_single=4,compare_set=1,compare_plan=1,api_single=2,api_plan=1'
+ADMIN_MIX = 'admin=3,admin_filtered=1,analytics=1'
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(ACTIONS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown action(s): {', '.join(sorted(unknown))}")
+    return mix
+
+def seed(db_path, args):
+    """Fresh database with the catalog, users and history; returns the catalog."""
+    from sqlalchemy import text
+    from catalog_import import import_catalog
+    from models import Session, engine, ComparisonHistory, University, User
+    from werkzeug.security import generate_password_hash
+
+    catalog = make_catalog(args.catalog, arabic_ratio=args.arabic_ratio, seed=args.seed)
+    session = Session()
+    try:
+        university = University(name='Dhofar University')
+        session.add(university)
+        session.commit()
+        rows = ({'title': f"{course.title} {course.id}", 'description': course.description, 'credits': course.credits,
+                 'department': course.department, 'prerequisites': None, 'language': course.language} for course in catalog)
+        started = time.perf_counter()
+        import_catalog(session, university.id, rows)
+        print(f"Seeded {len(catalog)} courses in {time.perf_counter() - started:.1f}s")
+
+        password_hash = generate_password_hash(PASSWORD)  # Hashed once; it's deliberately slow
+        users = [User(username=f"student{i}", role='student', password_hash=password_hash) for i in range(args.students)]
+        users += [User(username=f"admin{i}", role='admin', password_hash=password_hash) for i in range(args.admins)]
+        session.add_all(users)
+        session.commit()
+
+        rng = random.Random(args.seed)
+        course_ids = [course_id for (course_id,) in session.execute(text("SELECT id FROM university_courses"))]
+        students = [user.id for user in users if user.role == 'student']
+        history = []
+        for _ in range(args.history):
+            score = rng.uniform(20, 100)
+            history.append(ComparisonHistory(
+                user_id=rng.choice(students) if students else None,
+                input_data=json.dumps({'title': 'Seeded', 'desc': 'Seeded comparison', 'credits': 3}),
+                equivalency_score=score,
+                matched_course_id=rng.choice(course_ids),
+                decision='accepted' if score >= 80 else 'partial' if score >= 50 else 'rejected'
+            ))
+        session.add_all(history)
+        session.commit()
+    finally:
+        session.close()
+    with engine.connect() as connection:
+        # Readers don't block the writer (history inserts, plan jobs) and vice versa
+        connection.execute(text("PRAGMA journal_mode=WAL"))
+    return catalog
+
+def _course(course, rng):
+    return course.title, perturb(course.description, rng), str(course.credits)
+
+def student_page(client, catalog, rng):
+    return client.get('/student'), 200
+
+def compare_single(client, catalog, rng):
+    title, description, credits = _course(rng.choice(catalog), rng)
+    data = {'compare_type': 'single', 'title': title, 'description': description, 'credits': credits}
+    return client.post('/compare', data=data), 200
+
+def compare_set(client, catalog, rng):
+    courses = [_course(course, rng) for course in rng.sample(catalog, 3)]
+    data = {
+        'compare_type': 'set', 'pooling': rng.choice(['mean', 'max', 'credits']),
+        'titles[]': [c[0] for c in courses], 'descs[]': [c[1] for c in courses], 'credits[]': [c[2] for c in courses]
+    }
+    return client.post('/compare', data=data), 200
+
+def compare_plan(client, catalog, rng):
+    transcript = make_transcript(catalog, n_courses=20, seed=rng.randrange(1 << 30))
+    body = json.dumps([{k: row[k] for k in ('title', 'description', 'credits')} for row in transcript])
+    files = {'file': ('plan.json', body.encode('utf-8'), 'application/json')}
+    # Accepted plans redirect to their background job page, rejected ones back to the input page
+    return client.post('/compare', data={'compare_type': 'plan'}, files=files), '/jobs/'
+
+def api_single(client, catalog, rng):
+    courses = [dict(zip(('title', 'description', 'credits'), _course(course, rng))) for course in rng.sample(catalog, 10)]
+    return client.post('/api/compare', json={'compare_type': 'single', 'courses': courses, 'k': 5}), 200
+
+def api_plan(client, catalog, rng):
+    transcript = make_transcript(catalog, n_courses=40, seed=rng.randrange(1 << 30))
+    courses = [{k: row[k] for k in ('title', 'description', 'credits')} for row in transcript]
+    return client.post('/api/compare', json={'compare_type': 'plan', 'courses': courses, 'k': 3}), 200
+
+def admin(client, catalog, rng):
+    return client.get('/admin'), 200
+
+def admin_filtered(client, catalog, rng):
+    return client.get('/admin', params={'decision': rng.choice(['accepted', 'partial', 'rejected'])}), 200
+
+def analytics(client, catalog, rng):
+    return client.get('/admin/analytics'), 200
+
+ACTIONS = {fn.__name__: fn for fn in (student_page, compare_single, compare_set, compare_plan, api_single, api_plan,
+                                      admin, admin_filtered, analytics)}
+
+class Client:
+    """One simulated user: a cookie session against base_url that never follows redirects."""
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.http = requests.Session()
+
+    def get(self, path, **kwargs):
+        return self.http.get(self.base_url + path, allow_redirects=False, timeout=120, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.http.post(self.base_url + path, allow_redirects=False, timeout=120, **kwargs)
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)  # action -> [(seconds, ok)]
+        self.errors = defaultdict(lambda: defaultdict(int))  # action -> reason -> count
+        self.recording = False
+        self._lock = threading.Lock()
+
+    def record(self, action, seconds, ok, reason=None):
+        if not self.recording:
+            return
+        with self._lock:
+            self.samples[action].append((seconds, ok))
+            if not ok:
+                self.errors[action][reason] += 1
+
+def call(recorder, name, fn, client, catalog, rng):
+    started = time.perf_counter()
+    try:
+        response, expected = fn(client, catalog, rng)
+    except requests.RequestException as e:
+        recorder.record(name, time.perf_counter() - started, False, type(e).__name__)
+        return False
+    elapsed = time.perf_counter() - started
+    if isinstance(expected, str):  # A redirect to this path
+        ok = response.status_code == 302 and expected in response.headers.get('Location', '')
+    else:
+        ok = response.status_code == expected
+    reason = None if ok else f"HTTP {response.status_code}"
+    if not ok and response.status_code == 302:
+        reason = f"redirect to {response.headers.get('Location', '?')}"
+    recorder.record(name, elapsed, ok, reason)
+    return ok
+
+def run_user(base_url, username, mix, catalog, recorder, stop, think_ms, seed):
+    rng = random.Random(seed)
+    client = Client(base_url)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    def login(client, catalog, rng):
+        return client.post('/login', data={'username': username, 'password': PASSWORD}), 302
+
+    while not stop.is_set():
+        if not call(recorder, 'login', login, client, catalog, rng):
+            stop.wait(1.0)
+            continue
+        while not stop.is_set():
+            name = rng.choices(names, weights)[0]
+            call(recorder, name, ACTIONS[name], client, catalog, rng)
+            if think_ms:
+                stop.wait(rng.expovariate(1000.0 / think_ms))
+
+def summarize(recorder, elapsed):
+    report = {}
+    for action, samples in sorted(recorder.samples.items()):
+        ms = np.array([seconds for seconds, _ in samples]) * 1000
+        errors = sum(1 for _, ok in samples if not ok)
+        report[action] = {
+            'requests': len(samples),
+            'rps': len(samples) / elapsed,
+            'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)),
+            'p99_ms': float(np.percentile(ms, 99)),
+            'max_ms': float(ms.max()),
+            'error_rate': errors / len(samples),
+            'errors': dict(recorder.errors[action])
+        }
+    return report
+
+def print_report(report, elapsed):
+    print(f"{'action':<16} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+    for action, stats in report.items():
+        print(f"{action:<16} {stats['requests']:>7} {stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+              f"{stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f} {stats['error_rate']:>6.1%}")
+    total = sum(stats['requests'] for stats in report.values())
+    print(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    for action, stats in report.items():
+        for reason, count in stats['errors'].items():
+            print(f"  {action}: {count} x {reason}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stub', action='store_true', help="deterministic offline stub encoder")
+    parser.add_argument('--catalog', type=int, default=5000, help="synthetic catalog courses")
+    parser.add_argument('--arabic-ratio', type=float, default=0.2)
+    parser.add_argument('--history', type=int, default=5000, help="seeded comparison history rows")
+    parser.add_argument('--students', type=int, default=8, help="concurrent simulated students")
+    parser.add_argument('--admins', type=int, default=1, help="concurrent simulated admins")
+    parser.add_argument('--student-mix', type=parse_mix, default=STUDENT_MIX, help=f"action=weight,... (default {STUDENT_MIX})")
+    parser.add_argument('--admin-mix', type=parse_mix, default=ADMIN_MIX, help=f"action=weight,... (default {ADMIN_MIX})")
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=3, help="seconds of load before measuring starts")
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between a user's requests")
+    parser.add_argument('--db', help="SQLite file, recreated on every run (default: a temporary one, removed afterwards)")
+    parser.add_argument('--port', type=int, default=0, help="0 = any free port")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results JSON here")
+    args = parser.parse_args()
+
+    # Must be in place before config is first imported
+    tmp_dir = None if args.db else tempfile.mkdtemp(prefix='loadtest-')
+    db_path = os.path.abspath(args.db) if args.db else os.path.join(tmp_dir, 'loadtest.db')
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    os.environ['DATABASE_URI'] = f"sqlite:///{db_path}"
+
+    from werkzeug.serving import make_server
+    if args.stub:
+        from benchmarks.stub_encoder import install
+        install()
+    catalog = seed(db_path, args)
+
+    from app import app
+    import startup
+    startup.preload(fork=False)
+    startup.warm_up()
+    logging.getLogger().setLevel(logging.WARNING)  # The app logs at DEBUG/INFO; keep the report readable
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    server = make_server('127.0.0.1', args.port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"Serving on {base_url}: {args.students} students, {args.admins} admins for {args.warmup:.0f}s warm-up + {args.duration:.0f}s")
+
+    recorder = Recorder()
+    stop = threading.Event()
+    users = [(f"student{i}", args.student_mix) for i in range(args.students)]
+    users += [(f"admin{i}", args.admin_mix) for i in range(args.admins)]
+    threads = [
+        threading.Thread(target=run_user, args=(base_url, username, mix, catalog, recorder, stop, args.think_ms, args.seed + i), daemon=True)
+        for i, (username, mix) in enumerate(users)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=130)
+    server.shutdown()
+
+    report = summarize(recorder, elapsed)
+    print_report(report, elapsed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': {k: v for k, v in vars(args).items() if k != 'output'}, 'seconds': elapsed, 'actions': report}, f, indent=2)
+    if tmp_dir:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
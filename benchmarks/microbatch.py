@@ -0,0 +1,78 @@
+"""
+Throughput vs. latency of ai_comparator.encode_processed with and without
+the EncodeBatcher, at several concurrency levels.
+
+    python -m benchmarks.microbatch --stub
+    python -m benchmarks.microbatch --concurrency 1 4 16 --max-wait-ms 2
+
+--stub uses benchmarks.stub_encoder with a fixed per-call overhead, which
+models how a CPU forward pass is dominated by per-call cost for tiny
+inputs. Without --stub the real SentenceTransformer is loaded.
+"""
+import argparse
+import threading
+import time
+import numpy as np
+import ai_comparator
+from benchmarks.stub_encoder import install
+
+def run(concurrency, requests_per_thread, batching):
+    latencies = []
+    lock = threading.Lock()
+
+    def student(worker):
+        mine = []
+        for i in range(requests_per_thread):
+            text = f"introduction programming python loops functions {worker} {i}"
+            start = time.perf_counter()
+            ai_comparator.encode_processed([text], batching=batching)
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=student, args=(w,)) for w in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return {
+        'throughput': len(latencies) / elapsed,
+        'p50': float(np.percentile(ms, 50)),
+        'p95': float(np.percentile(ms, 95)),
+        'p99': float(np.percentile(ms, 99))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stub', action='store_true', help="use the offline stub encoder")
+    parser.add_argument('--stub-overhead-ms', type=float, default=8.0)
+    parser.add_argument('--stub-per-text-ms', type=float, default=0.3)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--requests', type=int, default=50, help="requests per thread")
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.stub:
+        install(call_overhead_ms=args.stub_overhead_ms, per_text_ms=args.stub_per_text_ms)
+    else:
+        ai_comparator.get_model()
+    batcher = ai_comparator._batcher
+    batcher.max_batch_size = args.max_batch
+    batcher.max_wait = args.max_wait_ms / 1000.0
+
+    print(f"{'conc':>5} {'mode':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'avg batch':>9}")
+    for concurrency in args.concurrency:
+        for batching in (False, True):
+            batches, texts = batcher.batches, batcher.batched_texts
+            stats = run(concurrency, args.requests, batching)
+            avg_batch = (batcher.batched_texts - texts) / max(batcher.batches - batches, 1) if batching else 1.0
+            mode = 'batched' if batching else 'direct'
+            print(f"{concurrency:>5} {mode:>8} {stats['throughput']:>9.1f} {stats['p50']:>8.2f} "
+                  f"{stats['p95']:>8.2f} {stats['p99']:>8.2f} {avg_batch:>9.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Speed and match quality of the preprocessing routes.
+
+Runs the same synthetic catalog (English + Arabic) and transcripts through
+three routing setups:
+    spacy   every language through en_core_web_sm
+    fast    every language through the regex/stopword fast path
+    routed  the configured PREPROCESS_ROUTES (default en=spacy, ar=fast)
+and reports, per language, preprocessing throughput (cold cache) and top-1
+plan accuracy against the course each transcript row was derived from.
+
+    python -m benchmarks.preprocess_routes --stub
+    python -m benchmarks.preprocess_routes --stub --size 5000 --arabic-ratio 0.5
+
+--stub swaps in benchmarks.stub_encoder so no model weights are needed; its
+bag-of-words vectors make accuracy track token overlap, so compare routes
+with the real model before changing the defaults.
+"""
+import argparse
+import time
+import numpy as np
+import ai_comparator
+from benchmarks.stub_encoder import install
+from benchmarks.synthetic import make_catalog, make_transcripts
+
+SETUPS = {
+    'spacy': ({}, 'spacy'),
+    'fast': ({}, 'fast'),
+    'routed': (dict(ai_comparator.PREPROCESS_ROUTES), ai_comparator.PREPROCESS_DEFAULT_ROUTE)
+}
+
+def _use_routes(routes, default):
+    ai_comparator.PREPROCESS_ROUTES = routes
+    ai_comparator.PREPROCESS_DEFAULT_ROUTE = default
+    with ai_comparator._preprocess_lock:
+        ai_comparator._preprocess_cache.clear()
+
+def bench_setup(catalog, transcripts, languages):
+    stats = {}
+    for language in languages:
+        courses = [course for course in catalog if course.language == language]
+        texts = [course.description for course in courses]
+        started = time.perf_counter()
+        ai_comparator.preprocess_texts(texts, languages=[language] * len(texts))
+        elapsed = time.perf_counter() - started
+        stats[language] = {'texts_per_s': len(texts) / elapsed if elapsed > 0 else 0.0, 'hits': []}
+
+    embeddings = ai_comparator.encode_texts(
+        [course.description for course in catalog], languages=[course.language for course in catalog]
+    )
+    by_id = {course.id: course for course in catalog}
+    for transcript in transcripts:
+        results, _ = ai_comparator.compute_plan_equivalency(transcript, catalog, dhofar_embeddings=embeddings)
+        for r in results:
+            language = by_id[r['input']['source_id']].language
+            hit = r['matched'] is not None and r['matched'].id == r['input']['source_id']
+            stats[language]['hits'].append(hit)
+    for language in languages:
+        hits = stats[language].pop('hits')
+        stats[language]['accuracy'] = float(np.mean(hits)) if hits else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stub', action='store_true', help="deterministic offline stub encoder")
+    parser.add_argument('--size', type=int, default=2000, help="catalog courses")
+    parser.add_argument('--arabic-ratio', type=float, default=0.3)
+    parser.add_argument('--transcripts', type=int, default=10)
+    parser.add_argument('--transcript-courses', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.stub:
+        install()
+    catalog = make_catalog(args.size, arabic_ratio=args.arabic_ratio, seed=args.seed)
+    transcripts = make_transcripts(catalog, args.transcripts, n_courses=args.transcript_courses, seed=args.seed)
+    languages = sorted({course.language for course in catalog})
+
+    routes, default = SETUPS['routed']
+    print(f"routed = {routes} (default {default})")
+    print(f"{'setup':<8} {'lang':<5} {'texts/s':>10} {'accuracy':>9}")
+    for name, (routes, default) in SETUPS.items():
+        _use_routes(routes, default)
+        for language, stats in bench_setup(catalog, transcripts, languages).items():
+            print(f"{name:<8} {language:<5} {stats['texts_per_s']:>10.1f} {stats['accuracy']:>9.2f}")
+    _use_routes(*SETUPS['routed'])
+
+if __name__ == '__main__':
+    main()
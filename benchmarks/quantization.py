@@ -0,0 +1,85 @@
+"""
+Accuracy and footprint of reduced-precision catalog storage.
+
+Encodes a synthetic catalog and perturbed copies of its descriptions as
+queries, then for each VECTOR_INDEX_DTYPE builds a flat VectorIndex and
+compares its answers with exact float32 cosine similarity (util.cos_sim):
+    top1     share of queries whose best course matches the float32 one
+    drift    mean / max |score - float32 score| of that best course, in points
+    bytes    stored bytes per vector and for the whole catalog
+    latency  mean search time per query batch
+
+    python -m benchmarks.quantization --stub
+    python -m benchmarks.quantization --stub --size 50000 --output quant.json
+
+--stub swaps in benchmarks.stub_encoder; its sparse bag-of-words vectors
+quantize differently from real sentence embeddings, so rerun without it
+before changing VECTOR_INDEX_DTYPE.
+"""
+import argparse
+import json
+import random
+import time
+import numpy as np
+import ai_comparator
+from sentence_transformers import util
+from vector_index import DTYPES, VectorIndex
+from benchmarks.stub_encoder import install
+from benchmarks.synthetic import make_catalog, perturb
+
+def bench_dtype(dtype, vectors, queries, reference, batch):
+    index = VectorIndex(vectors.shape[1], mode='flat', dtype=dtype)
+    index.add(np.arange(len(vectors)), vectors)
+    best = []
+    latencies = []
+    for start in range(0, len(queries), batch):
+        started = time.perf_counter()
+        best.extend(index.search(queries[start:start + batch], k=1))
+        latencies.append(time.perf_counter() - started)
+    top_ids = np.array([hits[0][0] for hits in best])
+    top_scores = np.array([hits[0][1] for hits in best])
+    ref_ids, ref_scores = reference
+    drift = np.abs(top_scores - ref_scores) * 100
+    return {
+        'top1_agreement': float(np.mean(top_ids == ref_ids)),
+        'drift_mean': float(drift.mean()),
+        'drift_max': float(drift.max()),
+        'bytes_per_vector': index.nbytes / len(vectors),
+        'catalog_mb': index.nbytes / 1e6,
+        'latency_ms': float(np.mean(latencies) * 1000)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stub', action='store_true', help="deterministic offline stub encoder")
+    parser.add_argument('--size', type=int, default=10000, help="catalog courses")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=50, help="queries per search call")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results JSON here")
+    args = parser.parse_args()
+
+    if args.stub:
+        install()
+    rng = random.Random(args.seed)
+    catalog = make_catalog(args.size, seed=args.seed)
+    sources = rng.sample(range(len(catalog)), min(args.queries, len(catalog)))
+    vectors = ai_comparator.encode_texts([course.description for course in catalog])
+    queries = ai_comparator.encode_texts([perturb(catalog[i].description, rng) for i in sources])
+
+    scores = np.asarray(util.cos_sim(queries, vectors), dtype=np.float32)
+    reference = (np.argmax(scores, axis=1), scores.max(axis=1))
+
+    report = {'args': {k: v for k, v in vars(args).items() if k != 'output'}, 'dtypes': {}}
+    print(f"{'dtype':<8} {'top1':>6} {'drift':>7} {'max':>7} {'B/vec':>7} {'MB':>8} {'ms/batch':>9}")
+    for dtype in DTYPES:
+        stats = bench_dtype(dtype, vectors, queries, reference, args.batch)
+        report['dtypes'][dtype] = stats
+        print(f"{dtype:<8} {stats['top1_agreement']:>6.3f} {stats['drift_mean']:>7.3f} {stats['drift_max']:>7.3f} "
+              f"{stats['bytes_per_vector']:>7.0f} {stats['catalog_mb']:>8.2f} {stats['latency_ms']:>9.2f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
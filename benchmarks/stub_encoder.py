@@ -0,0 +1,52 @@
+"""
+Deterministic stand-in for SentenceTransformer, so benchmarks run offline
+without model weights.
+
+Vectors are hashed bag-of-words (same text -> same vector, shared words ->
+positive cosine), which keeps matching behaviour plausible. Optional cost
+settings emulate a model on a saturated CPU: every encode() call holds one
+compute lock for call_overhead_ms + per_text_ms * len(texts).
+"""
+import hashlib
+import threading
+import time
+import numpy as np
+
+class StubEncoder:
+    def __init__(self, dim=384, call_overhead_ms=0.0, per_text_ms=0.0):
+        self.dim = dim
+        self.call_overhead_ms = call_overhead_ms
+        self.per_text_ms = per_text_ms
+        self._compute = threading.Lock()
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in (text or "").lower().split():
+            digest = hashlib.md5(word.encode('utf-8')).digest()
+            slot = int.from_bytes(digest[:4], 'little') % self.dim
+            vector[slot] += 1.0 if digest[4] & 1 else -1.0
+        vector[0] += 1e-3  # keep empty texts from being all-zero
+        return vector
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if self.call_overhead_ms or self.per_text_ms:
+            with self._compute:
+                time.sleep((self.call_overhead_ms + self.per_text_ms * len(texts)) / 1000.0)
+        if texts:
+            vectors = np.stack([self._vector(text) for text in texts])
+        else:
+            vectors = np.zeros((0, self.dim), dtype=np.float32)
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+def install(**kwargs):
+    """Swap the stub in as ai_comparator's model; returns it."""
+    import ai_comparator
+    ai_comparator.model = StubEncoder(**kwargs)
+    return ai_comparator.model
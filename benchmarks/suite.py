@@ -0,0 +1,193 @@
+"""
+Offline benchmark suite for the comparator and plan engine.
+
+For each catalog size it generates a synthetic catalog (English + Arabic)
+and transcripts (benchmarks.synthetic), then measures these stages:
+    preprocess_text      one description at a time, cold cache
+    preprocess_texts     the same descriptions as one batch, cold cache
+    encode_catalog       encode_texts over the whole catalog
+    compute_equivalency  single-course queries against stored embeddings
+    plan                 compute_plan_equivalency per transcript
+    plan_one_to_one      the same with one_to_one=True
+Each stage reports latency percentiles, throughput and peak Python memory
+(tracemalloc, measured on a separate run so tracing doesn't skew timings).
+Plan stages also report top-1 accuracy against the course each transcript
+row was derived from.
+
+    python -m benchmarks.suite --stub --sizes 100 1000 10000 --output bench.json
+    python -m benchmarks.suite --stub --output new.json --baseline bench.json
+    python -m benchmarks.suite --compare bench.json new.json
+
+--stub swaps in benchmarks.stub_encoder so no model weights are needed.
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import ai_comparator
+from benchmarks.stub_encoder import install
+from benchmarks.synthetic import make_catalog, make_transcripts
+
+# Metrics where larger is better; everything else (latencies, memory) should shrink
+HIGHER_IS_BETTER = {'throughput_per_s', 'accuracy'}
+COMPARED_METRICS = ['p50_ms', 'p95_ms', 'throughput_per_s', 'peak_mem_mb', 'accuracy']
+
+def _clear_preprocess_cache():
+    with ai_comparator._preprocess_lock:
+        ai_comparator._preprocess_cache.clear()
+
+def _peak_memory_mb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+def _summarize(latencies, items, elapsed):
+    ms = np.array(latencies) * 1000
+    return {
+        'count': len(latencies),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'throughput_per_s': items / elapsed if elapsed > 0 else 0.0
+    }
+
+def _timed_calls(fn, inputs, items_per_call=1):
+    latencies = []
+    started = time.perf_counter()
+    for item in inputs:
+        t = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t)
+    return _summarize(latencies, len(inputs) * items_per_call, time.perf_counter() - started)
+
+def bench_size(size, args):
+    catalog = make_catalog(size, arabic_ratio=args.arabic_ratio, seed=args.seed)
+    transcripts = make_transcripts(catalog, args.transcripts, n_courses=args.transcript_courses, seed=args.seed)
+    sample = [course.description for course in catalog[:args.preprocess_sample]]
+    stages = {}
+
+    _clear_preprocess_cache()
+    stages['preprocess_text'] = _timed_calls(ai_comparator.preprocess_text, sample)
+    _clear_preprocess_cache()
+    stages['preprocess_text']['peak_mem_mb'] = _peak_memory_mb(lambda: ai_comparator.preprocess_text(sample[0]))
+
+    _clear_preprocess_cache()
+    stages['preprocess_texts'] = _timed_calls(ai_comparator.preprocess_texts, [sample], items_per_call=len(sample))
+    _clear_preprocess_cache()
+    stages['preprocess_texts']['peak_mem_mb'] = _peak_memory_mb(lambda: ai_comparator.preprocess_texts(sample))
+
+    _clear_preprocess_cache()
+    descriptions = [course.description for course in catalog]
+    embeddings = {}
+    def encode_catalog(texts):
+        embeddings['catalog'] = ai_comparator.encode_texts(texts)
+    stages['encode_catalog'] = _timed_calls(encode_catalog, [descriptions], items_per_call=len(descriptions))
+    stages['encode_catalog']['peak_mem_mb'] = _peak_memory_mb(lambda: ai_comparator.encode_texts(descriptions))
+    catalog_embeddings = embeddings['catalog']
+
+    queries = [row['description'] for transcript in transcripts for row in transcript][:args.queries]
+    single = lambda desc: ai_comparator.compute_equivalency([desc], catalog, dhofar_embeddings=catalog_embeddings)
+    stages['compute_equivalency'] = _timed_calls(single, queries)
+    stages['compute_equivalency']['peak_mem_mb'] = _peak_memory_mb(lambda: single(queries[0]))
+
+    for name, one_to_one in (('plan', False), ('plan_one_to_one', True)):
+        hits = []
+        def plan(transcript):
+            results, _ = ai_comparator.compute_plan_equivalency(
+                transcript, catalog, dhofar_embeddings=catalog_embeddings, one_to_one=one_to_one
+            )
+            hits.extend(r['matched'] is not None and r['matched'].id == r['input']['source_id'] for r in results)
+        stats = _timed_calls(plan, transcripts, items_per_call=args.transcript_courses)
+        stats['accuracy'] = float(np.mean(hits)) if hits else 0.0
+        stats['peak_mem_mb'] = _peak_memory_mb(lambda: plan(transcripts[0]))
+        stages[name] = stats
+    return stages
+
+def compare(baseline, current, threshold):
+    """Print per-metric changes; returns the number of regressions beyond threshold (%)."""
+    regressions = 0
+    print(f"{'size':>7} {'stage':<20} {'metric':<17} {'baseline':>11} {'current':>11} {'change':>8}")
+    for size, stages in current['results'].items():
+        for stage, metrics in stages.items():
+            base = baseline['results'].get(size, {}).get(stage)
+            if not base:
+                continue
+            for metric in COMPARED_METRICS:
+                if metric not in metrics or metric not in base or not base[metric]:
+                    continue
+                change = (metrics[metric] - base[metric]) / base[metric] * 100
+                worse = -change if metric in HIGHER_IS_BETTER else change
+                flag = ' REGRESSION' if worse > threshold else ''
+                regressions += bool(flag)
+                print(f"{size:>7} {stage:<20} {metric:<17} {base[metric]:>11.3f} {metrics[metric]:>11.3f} {change:>+7.1f}%{flag}")
+    return regressions
+
+def print_report(report):
+    print(f"{'size':>7} {'stage':<20} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'items/s':>10} {'peak MB':>8} {'acc':>5}")
+    for size, stages in report['results'].items():
+        for stage, m in stages.items():
+            acc = f"{m['accuracy']:.2f}" if 'accuracy' in m else '-'
+            print(f"{size:>7} {stage:<20} {m['p50_ms']:>9.2f} {m['p95_ms']:>9.2f} {m['p99_ms']:>9.2f} "
+                  f"{m['throughput_per_s']:>10.1f} {m['peak_mem_mb']:>8.1f} {acc:>5}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stub', action='store_true', help="deterministic offline stub encoder")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--arabic-ratio', type=float, default=0.2)
+    parser.add_argument('--transcripts', type=int, default=10)
+    parser.add_argument('--transcript-courses', type=int, default=40)
+    parser.add_argument('--queries', type=int, default=200, help="single-course queries per size")
+    parser.add_argument('--preprocess-sample', type=int, default=500, help="descriptions used by the preprocess stages")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--baseline', help="compare this run against a saved results JSON")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help="only compare two saved runs")
+    parser.add_argument('--threshold', type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+    if args.stub:
+        install()
+    report = {
+        'meta': {
+            'created': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'encoder': 'stub' if args.stub else ai_comparator.EMBEDDING_MODEL,
+            'args': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'compare')}
+        },
+        'results': {}
+    }
+    for size in args.sizes:
+        print(f"Benchmarking catalog of {size} courses...", file=sys.stderr)
+        report['results'][str(size)] = bench_size(size, args)
+    # ru_maxrss is KiB on Linux
+    report['meta']['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(baseline, report, args.threshold) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Synthetic catalogs and transcripts for benchmarks.
+
+Everything is generated from a seeded RNG, so the same arguments always give
+the same data. Courses are plain objects with the UniversityCourse attributes
+the comparator reads, so no database is needed. Transcript courses are noisy
+rewrites of catalog courses and remember which course they came from
+(source_id), which lets benchmarks check match quality as well as speed.
+"""
+import random
+
+DEPARTMENTS = {
+    'Computer Science': [
+        'programming', 'python', 'algorithms', 'data', 'structures', 'loops', 'functions', 'recursion',
+        'databases', 'sql', 'normalization', 'networks', 'protocols', 'security', 'encryption',
+        'software', 'engineering', 'testing', 'objects', 'classes', 'compilers', 'memory', 'systems'
+    ],
+    'Mathematics': [
+        'calculus', 'limits', 'derivatives', 'integrals', 'series', 'matrices', 'vectors', 'linear',
+        'algebra', 'probability', 'statistics', 'distributions', 'proofs', 'sets', 'logic', 'geometry',
+        'differential', 'equations', 'optimization', 'numerical', 'methods', 'graphs', 'combinatorics'
+    ],
+    'Business': [
+        'accounting', 'finance', 'markets', 'management', 'marketing', 'strategy', 'economics',
+        'budgeting', 'auditing', 'leadership', 'organizations', 'operations', 'supply', 'chain',
+        'entrepreneurship', 'investment', 'risk', 'taxation', 'ethics', 'negotiation', 'sales'
+    ],
+    'Engineering': [
+        'circuits', 'signals', 'mechanics', 'thermodynamics', 'materials', 'design', 'control',
+        'power', 'electronics', 'fluids', 'structures', 'dynamics', 'statics', 'manufacturing',
+        'sensors', 'robotics', 'energy', 'heat', 'transfer', 'laboratory', 'measurement', 'analysis'
+    ]
+}
+
+ARABIC_WORDS = [
+    'البرمجة', 'الخوارزميات', 'البيانات', 'قواعد', 'الشبكات', 'الأمن', 'التشفير', 'البرمجيات',
+    'الحلقات', 'الدوال', 'التفاضل', 'التكامل', 'المصفوفات', 'الاحتمالات', 'الإحصاء', 'المحاسبة',
+    'المالية', 'الإدارة', 'التسويق', 'الاقتصاد', 'الدوائر', 'الإشارات', 'الميكانيكا', 'الطاقة',
+    'أساسيات', 'مقدمة', 'متقدم', 'تحليل', 'تصميم', 'أنظمة', 'نظرية', 'تطبيقات'
+]
+
+FILLER = ['introduction', 'to', 'the', 'of', 'and', 'with', 'basic', 'advanced', 'principles', 'students', 'learn', 'course', 'covers']
+
+class SyntheticCourse:
+    def __init__(self, id, title, description, credits, department, language, university_id):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.credits = credits
+        self.department = department
+        self.language = language
+        self.university_id = university_id
+
+def _sentence(rng, words, length):
+    out = []
+    for _ in range(length):
+        out.append(rng.choice(FILLER) if rng.random() < 0.3 else rng.choice(words))
+    return ' '.join(out).capitalize() + '.'
+
+def _arabic_sentence(rng, length):
+    return ' '.join(rng.choice(ARABIC_WORDS) for _ in range(length)) + '.'
+
+def make_catalog(n, arabic_ratio=0.2, universities=1, seed=0):
+    """n courses spread over departments (and universities), arabic_ratio of them in Arabic."""
+    rng = random.Random(seed)
+    departments = list(DEPARTMENTS)
+    courses = []
+    for i in range(n):
+        department = departments[i % len(departments)]
+        words = DEPARTMENTS[department]
+        if rng.random() < arabic_ratio:
+            language = 'ar'
+            title = ' '.join(rng.choice(ARABIC_WORDS) for _ in range(3))
+            description = ' '.join(_arabic_sentence(rng, rng.randint(8, 16)) for _ in range(2))
+        else:
+            language = 'en'
+            title = ' '.join(rng.choice(words).capitalize() for _ in range(3))
+            description = ' '.join(_sentence(rng, words, rng.randint(8, 16)) for _ in range(rng.randint(2, 4)))
+        courses.append(SyntheticCourse(
+            id=i + 1, title=title, description=description, credits=rng.choice([2, 3, 3, 4]),
+            department=department, language=language, university_id=1 + i % universities
+        ))
+    return courses
+
+def perturb(description, rng, drop=0.2):
+    """Drop and shuffle some words so the text is similar, not identical."""
+    words = description.split()
+    kept = [w for w in words if rng.random() >= drop] or words[:1]
+    for _ in range(len(kept) // 5):
+        a, b = rng.randrange(len(kept)), rng.randrange(len(kept))
+        kept[a], kept[b] = kept[b], kept[a]
+    return ' '.join(kept)
+
+def make_transcript(catalog, n_courses=40, seed=0):
+    """A transcript of noisy rewrites of n_courses random catalog courses."""
+    rng = random.Random(seed)
+    picks = rng.sample(catalog, min(n_courses, len(catalog)))
+    return [
+        {'title': course.title, 'description': perturb(course.description, rng),
+         'credits': str(course.credits), 'source_id': course.id}
+        for course in picks
+    ]
+
+def make_transcripts(catalog, count, n_courses=40, seed=0):
+    return [make_transcript(catalog, n_courses, seed=seed + i) for i in range(count)]
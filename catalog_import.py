@@ -0,0 +1,129 @@
+"""
+Bulk catalog import.
+
+Loads a university's courses from a CSV or JSON file in one transaction:
+rows are read as a stream (plan_upload parsers), upserted in batches by
+(university, title) with executemany-style bulk INSERT/UPDATE statements,
+and each batch's embeddings are computed in one encode pass and flushed in
+the same transaction. Nothing is committed unless the whole file succeeds.
+
+CSV/JSON fields: title, description, credits, department, prerequisites,
+language (default 'en'). Only title is required.
+
+    python catalog_import.py --university "Sultan Qaboos University" --create catalog.csv
+"""
+import argparse
+import logging
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import insert, update
+from models import Session, University, UniversityCourse, bump_revision
+from embedding_store import refresh_course_embeddings
+from plan_upload import iter_upload_rows, PlanUploadError
+
+def normalize_course(row, line):
+    if not isinstance(row, dict):
+        raise PlanUploadError(f"Row {line}: expected an object with course fields")
+    title = (row.get('title') or '').strip()
+    if not title:
+        raise PlanUploadError(f"Row {line}: title is required")
+    credits = row.get('credits')
+    try:
+        credits = int(credits) if credits not in (None, '') else None
+    except (TypeError, ValueError):
+        raise PlanUploadError(f"Row {line}: credits must be a whole number")
+    return {
+        'title': title[:200],
+        'description': row.get('description') or None,
+        'credits': credits,
+        'department': (row.get('department') or None),
+        'prerequisites': row.get('prerequisites') or None,
+        'language': (row.get('language') or 'en')[:10]
+    }
+
+def import_catalog(session, university_id, rows, batch_size=1000, embed=True):
+    """
+    Upsert an iterable of normalized course dicts into one university's
+    catalog and commit once at the end. Returns counts and rows/sec.
+    """
+    started = time.perf_counter()
+    existing = dict(session.query(UniversityCourse.title, UniversityCourse.id).filter(
+        UniversityCourse.university_id == university_id
+    ))
+    stats = {'inserted': 0, 'updated': 0, 'embedded': 0}
+
+    def flush(batch):
+        # Last occurrence of a title within the batch wins
+        batch = list({row['title']: row for row in batch}.values())
+        new_rows = [dict(row, university_id=university_id) for row in batch if row['title'] not in existing]
+        changed = [dict(row, id=existing[row['title']], updated_at=datetime.utcnow()) for row in batch if row['title'] in existing]
+        if new_rows:
+            new_ids = session.scalars(insert(UniversityCourse).returning(UniversityCourse.id, sort_by_parameter_order=True), new_rows).all()
+            existing.update((row['title'], course_id) for row, course_id in zip(new_rows, new_ids))
+            stats['inserted'] += len(new_rows)
+        if changed:
+            session.execute(update(UniversityCourse), changed)
+            stats['updated'] += len(changed)
+        if new_rows or changed:
+            bump_revision(session, 'catalog')  # Bulk statements bypass the flush hook
+        if embed:
+            ids = [existing[row['title']] for row in batch]
+            courses = session.query(UniversityCourse).filter(UniversityCourse.id.in_(ids)).populate_existing().all()
+            stats['embedded'] += refresh_course_embeddings(session, courses, commit=False)
+
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    stats['seconds'] = time.perf_counter() - started
+    total = stats['inserted'] + stats['updated']
+    stats['rows_per_sec'] = total / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    logging.info(f"Catalog import: {stats['inserted']} inserted, {stats['updated']} updated, "
+                 f"{stats['embedded']} embedded in {stats['seconds']:.1f}s ({stats['rows_per_sec']:.0f} rows/s)")
+    return stats
+
+def import_catalog_file(session, university_id, stream, filename, max_bytes=None, batch_size=1000, embed=True):
+    rows = iter_upload_rows(stream, filename, max_bytes, normalize=normalize_course)
+    return import_catalog(session, university_id, rows, batch_size=batch_size, embed=embed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', help="CSV or JSON catalog")
+    parser.add_argument('--university', required=True, help="university name")
+    parser.add_argument('--create', action='store_true', help="create the university if it doesn't exist")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--no-embed', action='store_true', help="skip embeddings (computed lazily on first compare)")
+    args = parser.parse_args()
+
+    session = Session()
+    try:
+        university = session.query(University).filter_by(name=args.university).first()
+        if university is None:
+            if not args.create:
+                sys.exit(f"No university named {args.university!r} (use --create)")
+            university = University(name=args.university)
+            session.add(university)
+            session.commit()
+        with open(args.file, 'rb') as f:
+            stats = import_catalog_file(session, university.id, f, args.file,
+                                        batch_size=args.batch_size, embed=not args.no_embed)
+    except PlanUploadError as e:
+        sys.exit(f"Import failed: {e}")
+    finally:
+        session.close()
+    print(f"Imported {stats['inserted']} new and {stats['updated']} updated courses "
+          f"({stats['embedded']} embedded) in {stats['seconds']:.1f}s - {stats['rows_per_sec']:.0f} rows/sec")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+Persistent catalog embeddings.
+
+Each UniversityCourse gets one CourseEmbedding row per model name, tagged with
+a sha256 of the description it was computed from (and of the preprocessing
+route, when that isn't spaCy). Lookups compare that hash against the current
+description, so a changed course is re-encoded on the next request and
+everything else is read back instead of going through the model.
+
+The same vectors feed a process-wide VectorIndex over every university's
+courses (see get_catalog_index), kept in sync incrementally. The index is the
+only in-process copy: it holds them in VECTOR_INDEX_DTYPE, tagged with their
+content hash, and get_catalog_embeddings reads them back from it. With
+VECTOR_INDEX_MMAP_DIR set the index matrix built at startup lives in a
+memory-mapped file that all workers on the host share. Courses added later go
+to a small private tail; the mapped block stays shared.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import numpy as np
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, or_, select
+from models import Session, CourseEmbedding, UniversityCourse, read_revision
+from ai_comparator import encode_texts, preprocess_route
+from vector_index import VectorIndex
+import metrics
+from config import (EMBEDDING_MODEL, VECTOR_INDEX_MODE, VECTOR_INDEX_NLIST,
+                    VECTOR_INDEX_NPROBE, VECTOR_INDEX_TRAIN_MIN, VECTOR_INDEX_DTYPE,
+                    VECTOR_INDEX_MMAP_DIR, CATALOG_SYNC_INTERVAL)
+
+# Catalog index over all universities, the catalog_version it reflects, the
+# _sync_marks taken at that sync and when the revision is due to be read again
+_index = None
+_index_version = None
+_index_marks = None
+_next_check = 0.0
+_SYNC_OVERLAP = timedelta(minutes=5)
+_index_lock = threading.RLock()
+_INDEX_CHUNK = 2000
+
+def content_hash(text, route='spacy'):
+    text = text or ""
+    if route != 'spacy':
+        # Other pipelines give different vectors for the same text; spaCy hashes stay as they were
+        text = f"{route}:{text}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def course_hash(course):
+    return content_hash(course.description, preprocess_route(course.description, course.language))
+
+def _tag(digest):
+    """A content hash as the VectorIndex tag of its vector (60 bits, so never negative)."""
+    return int(digest[:15], 16)
+
+def _load_embeddings(session, courses, force=False, commit=True):
+    """
+    course id -> (content_hash, float32 vector) for courses, read from their
+    stored rows; missing or stale ones are encoded in one batch and upserted.
+    Also returns the courses that were encoded.
+    """
+    stored = {
+        row.course_id: row for row in session.query(CourseEmbedding).filter(
+            CourseEmbedding.course_id.in_([course.id for course in courses]),
+            CourseEmbedding.model_name == EMBEDDING_MODEL
+        )
+    }
+
+    fresh = {}
+    stale = []
+    for course in courses:
+        digest = course_hash(course)
+        row = stored.get(course.id)
+        if row is not None and row.content_hash == digest and not force:
+            fresh[course.id] = (digest, np.frombuffer(row.vector, dtype=np.float32))
+        else:
+            stale.append((course, digest))
+
+    if stale:
+        logging.info(f"Encoding {len(stale)} catalog course(s) with {EMBEDDING_MODEL}")
+        vectors = encode_texts([course.description for course, _ in stale], languages=[course.language for course, _ in stale])
+        for (course, digest), vector in zip(stale, vectors):
+            row = stored.get(course.id)
+            if row is None:
+                row = CourseEmbedding(course_id=course.id, model_name=EMBEDDING_MODEL)
+                session.add(row)
+            row.content_hash = digest
+            row.dim = int(vector.shape[0])
+            row.vector = vector.astype(np.float32).tobytes()
+            row.updated_at = datetime.utcnow()
+            fresh[course.id] = (digest, vector.astype(np.float32))
+        if commit:
+            session.commit()
+        else:
+            session.flush()
+    return fresh, [course for course, _ in stale]
+
+def refresh_course_embeddings(session, courses, force=False, commit=True):
+    """
+    Make sure every course has an up-to-date stored embedding.
+    Rows whose hash still matches are only loaded; missing or stale ones are
+    encoded in one batch and upserted. Returns the number of courses encoded.
+    With commit=False the rows are only flushed into the caller's transaction
+    and the catalog index picks them up once that commits.
+    """
+    if not courses:
+        return 0
+    fresh, encoded = _load_embeddings(session, courses, force=force, commit=commit)
+    if encoded and commit:
+        _add_to_index(encoded, [fresh[course.id] for course in encoded])
+    return len(encoded)
+
+def get_catalog_embeddings(session, courses):
+    """
+    Return an (n, dim) float32 matrix whose rows line up with courses.
+    Rows come from the catalog index when it holds the course's current
+    content hash, otherwise from the stored embeddings (encoding stale ones).
+    """
+    if not courses:
+        return None
+    digests = [course_hash(course) for course in courses]
+    index = _index
+    if index is not None:
+        tags, vectors = index.lookup([course.id for course in courses])
+        missing = [i for i, (digest, tag) in enumerate(zip(digests, tags)) if tag != _tag(digest)]
+    else:
+        vectors = None
+        missing = list(range(len(courses)))
+    metrics.cache_result('catalog_embeddings', len(courses) - len(missing), len(missing))
+    if missing:
+        fresh, _ = _load_embeddings(session, [courses[i] for i in missing])
+        if vectors is None:
+            return np.vstack([fresh[course.id][1] for course in courses])
+        for i in missing:
+            vectors[i] = fresh[courses[i].id][1]
+    return vectors
+
+def catalog_courses(session, university_id=None, department=None, language=None):
+    """Courses of one university's catalog, optionally narrowed by department/language."""
+    query = session.query(UniversityCourse).filter(UniversityCourse.university_id == university_id)
+    if department:
+        query = query.filter(UniversityCourse.department == department)
+    if language:
+        query = query.filter(UniversityCourse.language == language)
+    return query.all()
+
+def catalog_version(session):
+    """Catalog revision, bumped in the transaction of every course or embedding change (models.bump_revision)."""
+    return read_revision(session, 'catalog')
+
+def _sync_marks(session):
+    """
+    (last course update, last embedding update, max course id): where the next
+    incremental sync starts. A timestamp is None while no row has one yet
+    (empty tables, or rows from before the column was added).
+    """
+    course_update, max_id = session.query(func.max(UniversityCourse.updated_at), func.max(UniversityCourse.id)).one()
+    embedding_update = session.query(func.max(CourseEmbedding.updated_at)).filter(
+        CourseEmbedding.model_name == EMBEDDING_MODEL
+    ).scalar()
+    return (course_update, embedding_update, max_id or 0)
+
+def _changed_since(column, mark):
+    if mark is None:
+        return column.isnot(None)  # Nothing was stamped at the last sync: every stamped row is newer
+    # Timestamps come from each writer's clock and commit order isn't timestamp order: look back a little
+    return column > mark - _SYNC_OVERLAP
+
+def _add_to_index(courses, embeddings):
+    """Add courses with their (content_hash, vector) pairs, see _load_embeddings."""
+    with _index_lock:
+        if _index is None:
+            return
+        _index.add(
+            [course.id for course in courses], np.vstack([vector for _, vector in embeddings]),
+            university_ids=[course.university_id for course in courses],
+            departments=[course.department for course in courses],
+            languages=[course.language for course in courses],
+            tags=[_tag(digest) for digest, _ in embeddings]
+        )
+
+def _index_courses(session, query):
+    for start in range(0, query.count(), _INDEX_CHUNK):
+        courses = query.order_by(UniversityCourse.id).offset(start).limit(_INDEX_CHUNK).all()
+        if courses:
+            fresh, _ = _load_embeddings(session, courses)
+            _add_to_index(courses, [fresh[course.id] for course in courses])
+
+def _stale_course_ids(session, condition):
+    """
+    Ids of the courses matching condition whose index row is missing or out
+    of date (content hash, university, department or language), read from
+    plain columns so unchanged courses never load or re-add.
+    """
+    rows = session.query(
+        UniversityCourse.id, UniversityCourse.description, UniversityCourse.language,
+        UniversityCourse.university_id, UniversityCourse.department
+    ).filter(condition).all()
+    if not rows:
+        return []
+    stale = _index.stale(
+        [row.id for row in rows], [_tag(course_hash(row)) for row in rows],
+        university_ids=[row.university_id for row in rows],
+        departments=[row.department for row in rows],
+        languages=[row.language for row in rows]
+    )
+    return [row.id for row, is_stale in zip(rows, stale) if is_stale]
+
+def get_catalog_index(session):
+    """
+    Return the process-wide VectorIndex over all universities' courses.
+    Built on first use. Afterwards the catalog revision is read at most every
+    CATALOG_SYNC_INTERVAL seconds (right away after this process changed the
+    catalog), outside the index lock; when it moved, courses inserted,
+    edited or re-embedded since the last sync (possibly by another worker)
+    are re-added, re-encoding stale descriptions, and deleted ones removed.
+    """
+    global _index, _index_version, _index_marks, _next_check
+    if _index is not None and time.monotonic() < _next_check:
+        return _index
+    _next_check = time.monotonic() + CATALOG_SYNC_INTERVAL
+    revision = catalog_version(session)
+    if _index is not None and revision == _index_version:
+        return _index
+
+    with _index_lock:
+        if _index is not None and revision == _index_version:
+            return _index  # Another thread synced while we waited
+        marks = _sync_marks(session)
+        if _index is None:
+            logging.info("Building catalog vector index")
+            _index = VectorIndex(
+                _embedding_dim(session), mode=VECTOR_INDEX_MODE, nlist=VECTOR_INDEX_NLIST,
+                nprobe=VECTOR_INDEX_NPROBE, train_min=VECTOR_INDEX_TRAIN_MIN, dtype=VECTOR_INDEX_DTYPE
+            )
+            _index_courses(session, session.query(UniversityCourse))
+            logging.info(f"Catalog vector index ready: {len(_index)} courses")
+            if VECTOR_INDEX_MMAP_DIR:
+                # Only here: hashing and writing the matrix is too slow for a request's incremental sync
+                _index.share_vectors(os.path.join(VECTOR_INDEX_MMAP_DIR, f"catalog_{EMBEDDING_MODEL.replace('/', '_')}_{VECTOR_INDEX_DTYPE}"))
+        else:
+            course_update, embedding_update, max_id = _index_marks
+            reembedded = session.query(CourseEmbedding.course_id).filter(
+                CourseEmbedding.model_name == EMBEDDING_MODEL,
+                _changed_since(CourseEmbedding.updated_at, embedding_update)
+            )
+            # The look-back window keeps matching rows already synced; only re-add what differs
+            stale = _stale_course_ids(session, or_(
+                UniversityCourse.id > max_id,
+                _changed_since(UniversityCourse.updated_at, course_update),
+                UniversityCourse.id.in_(reembedded)
+            ))
+            for start in range(0, len(stale), _INDEX_CHUNK):
+                courses = session.query(UniversityCourse).filter(UniversityCourse.id.in_(stale[start:start + _INDEX_CHUNK])).all()
+                fresh, _ = _load_embeddings(session, courses)
+                _add_to_index(courses, [fresh[course.id] for course in courses])
+            if len(_index) != session.query(func.count(UniversityCourse.id)).scalar():
+                live = set(session.scalars(select(UniversityCourse.id)))
+                _index.remove([course_id for course_id in _index.ids() if course_id not in live])
+            logging.info(f"Catalog vector index synced to revision {revision}: {len(stale)} updated, {len(_index)} courses")
+
+        _index_marks = marks
+        _index_version = revision
+        return _index
+
+@event.listens_for(Session, 'after_commit')
+def _catalog_committed(session):
+    global _next_check
+    if 'catalog' in session.info.pop('bumped_revisions', ()):
+        _next_check = 0.0  # This process changed the catalog; don't wait out the interval
+
+def index_version():
+    """catalog_version() as of the last get_catalog_index sync."""
+    return _index_version
+
+def _embedding_dim(session):
+    dim = session.query(CourseEmbedding.dim).filter(CourseEmbedding.model_name == EMBEDDING_MODEL).limit(1).scalar()
+    if dim is None:
+        dim = encode_texts(["dimension probe"]).shape[1]
+    return int(dim)
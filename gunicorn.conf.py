@@ -0,0 +1,17 @@
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+timeout = 120
+
+# Import the app (and load models + catalog embeddings) once in the master;
+# forked workers share that memory copy-on-write
+preload_app = True
+
+def when_ready(server):
+    import startup
+    startup.preload()
+
+def post_fork(server, worker):
+    import startup
+    startup.warm_up()
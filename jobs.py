@@ -0,0 +1,138 @@
+"""
+Background plan comparisons.
+
+A plan upload is parsed in the request, stored as a PlanJob row and handed to
+a small in-process thread pool, so the request returns a job id right away.
+The worker scores the plan in chunks and appends each chunk's results to the
+row: the status endpoint streams per-course results while the job runs, and a
+finished job can be shown again without recomputing.
+
+The pool lives in the web worker process, so a job dies with it. The worker
+thread stamps heartbeat_at as it goes; a queued or running job that hasn't
+moved for PLAN_JOB_STALE_AFTER seconds is marked failed (expire_stale_jobs,
+run at startup and whenever a job is read) instead of spinning forever.
+"""
+import json
+import logging
+import threading
+import uuid
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from models import Session, PlanJob
+from ai_comparator import compute_plan_equivalency
+from embedding_store import catalog_courses, get_catalog_embeddings
+from config import PLAN_JOB_WORKERS, PLAN_JOB_CHUNK, PLAN_JOB_STALE_AFTER
+from metrics import timed
+
+# Created on first submit, so a pre-fork import never leaves threads behind in the master
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PLAN_JOB_WORKERS, thread_name_prefix='plan-job')
+        return _executor
+
+def submit_plan_job(user_id, input_plan, filters, one_to_one=False):
+    """Queue a plan comparison; returns the job id."""
+    session = Session()
+    try:
+        job = PlanJob(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            status='queued',
+            total=len(input_plan),
+            completed=0,
+            input_data=json.dumps(input_plan),
+            options=json.dumps({'filters': filters, 'one_to_one': one_to_one}),
+            results='[]'
+        )
+        session.add(job)
+        session.commit()
+        job_id = job.id
+    finally:
+        session.close()
+    get_executor().submit(run_plan_job, job_id)
+    return job_id
+
+def expire_stale_jobs(session, job_id=None):
+    """Fail queued/running jobs (or just job_id) whose worker went quiet; returns how many."""
+    cutoff = datetime.utcnow() - timedelta(seconds=PLAN_JOB_STALE_AFTER)
+    query = session.query(PlanJob).filter(
+        PlanJob.status.in_(('queued', 'running')),
+        func.coalesce(PlanJob.heartbeat_at, PlanJob.created_at) < cutoff
+    )
+    if job_id is not None:
+        query = query.filter(PlanJob.id == job_id)
+    expired = query.update({
+        'status': 'failed',
+        'error': 'The worker running this job stopped; please submit the plan again',
+        'finished_at': datetime.utcnow()
+    }, synchronize_session=False)
+    session.commit()
+    if expired:
+        logging.warning(f"Marked {expired} stale plan job(s) as failed")
+    return expired
+
+def serialize_result(result):
+    matched = result['matched']
+    return {
+        'title': result['input'].get('title'),
+        'credits': result['input'].get('credits'),
+        'matched_id': matched.id if matched else None,
+        'matched_title': matched.title if matched else None,
+        'matched_credits': matched.credits if matched else None,
+        'score': result['score']
+    }
+
+def run_plan_job(job_id):
+    session = Session()
+    try:
+        job = session.get(PlanJob, job_id)
+        if job is None or job.status != 'queued':
+            return  # Expired while it waited in the queue
+        job.status = 'running'
+        job.heartbeat_at = datetime.utcnow()
+        session.commit()
+
+        input_plan = json.loads(job.input_data)
+        options = json.loads(job.options)
+        with timed('catalog_query'):
+            dhofar_courses = catalog_courses(session, **options['filters'])
+            dhofar_embeddings = get_catalog_embeddings(session, dhofar_courses)
+
+        # One-to-one assignment is global, so it can't be split into chunks
+        chunk = max(len(input_plan), 1) if options['one_to_one'] else PLAN_JOB_CHUNK
+        results = []
+        for start in range(0, len(input_plan), chunk):
+            chunk_results, _ = compute_plan_equivalency(
+                input_plan[start:start + chunk], dhofar_courses,
+                dhofar_embeddings=dhofar_embeddings, one_to_one=options['one_to_one']
+            )
+            results.extend(serialize_result(r) for r in chunk_results)
+            job.results = json.dumps(results)
+            job.completed = len(results)
+            job.heartbeat_at = datetime.utcnow()
+            session.commit()
+
+        overall_score = float(np.mean([r['score'] for r in results])) if results else 0.0
+        job.overall_score = overall_score
+        job.decision = 'accepted' if overall_score >= 80 else 'partial' if overall_score >= 50 else 'rejected'
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        session.commit()
+    except Exception as e:
+        logging.exception(f"Plan job {job_id} failed")
+        session.rollback()
+        job = session.get(PlanJob, job_id)
+        if job:
+            job.status = 'failed'
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            session.commit()
+    finally:
+        session.close()
@@ -0,0 +1,125 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms live in this process; under gunicorn each worker
+keeps its own set, so series carry a `pid` label and Prometheus should
+scrape (or sum) every worker.
+
+timed(stage) records a stage duration both in the equiv_stage_seconds
+histogram and in the breakdown of the request running on this thread
+(start_request / finish_request), which the slow-request log prints.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+HELP = {
+    'equiv_stage_seconds': ('histogram', "Time spent per comparison stage"),
+    'equiv_http_request_seconds': ('histogram', "Request latency per endpoint"),
+    'equiv_http_requests_total': ('counter', "Requests per endpoint and status"),
+    'equiv_cache_requests_total': ('counter', "Cache lookups by cache and result (hit/miss)"),
+    'equiv_encode_batch_size': ('histogram', "Texts per model.encode call"),
+    'equiv_preprocess_batch_size': ('histogram', "Texts per nlp.pipe run (cache misses only)"),
+    'equiv_db_pool_checkout_seconds': ('histogram', "Wait for a pooled database connection"),
+    'equiv_db_pool_checked_out': ('gauge', "Pooled database connections currently in use"),
+    'equiv_db_pool_overflow': ('gauge', "Connections open beyond the pool size")
+}
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts, sum, count, buckets]
+_gauges = {}  # (name, labels without pid) -> callable, read at render time
+_local = threading.local()
+
+def _key(name, labels):
+    labels = dict(labels, pid=os.getpid())
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, buckets=TIME_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [[0] * len(buckets), 0.0, 0, buckets]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist[0][i] += 1
+        hist[1] += value
+        hist[2] += 1
+
+def gauge(name, fn, **labels):
+    """Register a gauge whose value is fn(), read whenever metrics are rendered."""
+    with _lock:
+        _gauges[(name, tuple(sorted(labels.items())))] = fn
+
+def cache_result(cache, hits, misses):
+    if hits:
+        inc('equiv_cache_requests_total', hits, cache=cache, result='hit')
+    if misses:
+        inc('equiv_cache_requests_total', misses, cache=cache, result='miss')
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe('equiv_stage_seconds', elapsed, stage=stage)
+        breakdown = getattr(_local, 'breakdown', None)
+        if breakdown is not None:
+            breakdown[stage] = breakdown.get(stage, 0.0) + elapsed
+
+def start_request():
+    _local.breakdown = {}
+    _local.started = time.perf_counter()
+
+def finish_request():
+    """Returns (total seconds, {stage: seconds}) for the request on this thread."""
+    breakdown = getattr(_local, 'breakdown', None) or {}
+    started = getattr(_local, 'started', None)
+    _local.breakdown = None
+    total = time.perf_counter() - started if started is not None else 0.0
+    return total, breakdown
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{str(v)}"' for k, v in items) + '}'
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(h[0]), h[1], h[2], h[3]) for key, h in _histograms.items()}
+        gauges = dict(_gauges)
+    # Registered before fork in a preloaded master, so the pid label is added here
+    gauges = {_key(name, dict(labels)): fn() for (name, labels), fn in gauges.items()}
+    lines = []
+    names = sorted({name for name, _ in counters} | {name for name, _ in histograms} | {name for name, _ in gauges})
+    for name in names:
+        kind, text = HELP.get(name, ('untyped', name))
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), value in sorted(counters.items()) + sorted(gauges.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (metric, labels), (buckets, total, count, bounds) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, bucket in zip(bounds, buckets):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {bucket}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
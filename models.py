@@ -1,12 +1,42 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, ForeignKey, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Text, Float, ForeignKey, Date, DateTime, LargeBinary, UniqueConstraint, event, inspect, text, case, func, insert, literal_column, select, update
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
+import json
+import time
 from werkzeug.security import generate_password_hash, check_password_hash
-from config import DATABASE_URI
+import metrics
+from config import (DATABASE_URI, DATABASE_READ_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW,
+                    DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING)
 
-engine = create_engine(DATABASE_URI)
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            metrics.observe('equiv_db_pool_checkout_seconds', time.perf_counter() - started, pool=self.logging_name)
+
+def make_engine(uri, name):
+    if uri.startswith('sqlite') and ':memory:' in uri:
+        return create_engine(uri)  # One shared in-memory connection; nothing to pool
+    engine = create_engine(
+        uri, poolclass=TimedQueuePool, pool_logging_name=name, pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=DB_POOL_PRE_PING
+    )
+    # engine.pool is replaced by dispose(), so read it through the engine
+    metrics.gauge('equiv_db_pool_checked_out', lambda: engine.pool.checkedout(), pool=name)
+    metrics.gauge('equiv_db_pool_overflow', lambda: max(engine.pool.overflow(), 0), pool=name)
+    return engine
+
+engine = make_engine(DATABASE_URI, 'primary')
+# Read-only admin listings; the primary unless DATABASE_READ_URI points at a replica
+read_engine = make_engine(DATABASE_READ_URI, 'replica') if DATABASE_READ_URI else engine
 Base = declarative_base()
 Session = sessionmaker(bind=engine)
+ReadSession = sessionmaker(bind=read_engine)
 
 class User(Base):
     __tablename__ = 'users'
@@ -38,8 +68,21 @@ class UniversityCourse(Base):
     prerequisites = Column(Text)
     language = Column(String(10), default='en')
     university_id = Column(Integer, ForeignKey('universities.id'))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     university = relationship("University", back_populates="courses")
 
+class CourseEmbedding(Base):
+    __tablename__ = 'course_embeddings'
+    __table_args__ = (UniqueConstraint('course_id', 'model_name'),)
+    id = Column(Integer, primary_key=True)
+    course_id = Column(Integer, ForeignKey('university_courses.id', ondelete='CASCADE'), nullable=False, index=True)
+    model_name = Column(String(100), nullable=False)
+    content_hash = Column(String(64), nullable=False)  # sha256 of the text that was encoded
+    dim = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)  # float32 bytes
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    course = relationship("UniversityCourse")
+
 class Plan(Base):
     __tablename__ = 'plans'
     id = Column(Integer, primary_key=True)
@@ -50,15 +93,157 @@ class Plan(Base):
 class ComparisonHistory(Base):
     __tablename__ = 'comparison_history'
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
     input_data = Column(Text)  
+    input_summary = Column(Text)  # Display string, filled in on insert (see summarize_input_data)
     equivalency_score = Column(Float)
     matched_course_id = Column(Integer, ForeignKey('university_courses.id'))
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    decision = Column(String(20))  
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    decision = Column(String(20), index=True)  
     matched_course = relationship("UniversityCourse")
     user = relationship("User")
 
+def summarize_input_data(input_str):
+    """One-line admin summary of a history row's JSON input."""
+    if not input_str:
+        return "No data"
+    try:
+        data = json.loads(input_str)
+        if isinstance(data, dict):  # Single course
+            data = [data]
+        if isinstance(data, list):  # Set or plan
+            return " | ".join(f"Title: {item['title']} - Desc: {item['desc'][:50]}... ({item['credits']} credits)" for item in data)
+        return input_str  # Fallback
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return "Invalid data"
+
+@event.listens_for(ComparisonHistory, 'before_insert')
+def _summarize_history(mapper, connection, target):
+    if target.input_summary is None:
+        target.input_summary = summarize_input_data(target.input_data)
+
+class HistoryStats(Base):
+    """
+    Pre-aggregated ComparisonHistory counts, one row per (day, matched course,
+    decision, score decile), kept up to date on every history insert so the
+    analytics page never scans the history table.
+    """
+    __tablename__ = 'history_stats'
+    day = Column(Date, primary_key=True)
+    matched_course_id = Column(Integer, primary_key=True, default=0)  # 0 = no match
+    decision = Column(String(20), primary_key=True)
+    score_bucket = Column(Integer, primary_key=True)  # 0 = [0, 10), ..., 9 = [90, 100]
+    requests = Column(Integer, nullable=False, default=0)
+    score_total = Column(Float, nullable=False, default=0.0)
+
+def score_bucket(score):
+    return min(max(int((score or 0.0) // 10), 0), 9)
+
+def _score_bucket_sql(score):
+    # Portable floor(score / 10) clamped to 0..9. Literals rather than bound parameters,
+    # so PostgreSQL sees the same expression in SELECT and GROUP BY
+    return case(*[(score < literal_column(str(10 * (i + 1))), literal_column(str(i))) for i in range(9)], else_=literal_column('9'))
+
+@event.listens_for(ComparisonHistory, 'after_insert')
+def _count_history(mapper, connection, target):
+    score = target.equivalency_score or 0.0
+    key = {
+        'day': (target.timestamp or datetime.utcnow()).date(),
+        'matched_course_id': target.matched_course_id or 0,
+        'decision': target.decision or 'unknown',
+        'score_bucket': score_bucket(score)
+    }
+    stats = HistoryStats.__table__
+    increment = {'requests': stats.c.requests + 1, 'score_total': stats.c.score_total + score}
+    if connection.dialect.name in ('postgresql', 'sqlite'):
+        if connection.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        connection.execute(upsert(stats).values(dict(key, requests=1, score_total=score)).on_conflict_do_update(
+            index_elements=list(key), set_=increment
+        ))
+        return
+    where = [stats.c[name] == value for name, value in key.items()]
+    if connection.execute(update(stats).where(*where).values(increment)).rowcount == 0:
+        connection.execute(insert(stats).values(dict(key, requests=1, score_total=score)))
+
+def rebuild_history_stats(connection):
+    """Recompute history_stats from ComparisonHistory with one GROUP BY (backfill / after bulk deletes)."""
+    history = ComparisonHistory.__table__
+    stats = HistoryStats.__table__
+    score = func.coalesce(history.c.equivalency_score, literal_column('0.0'))
+    columns = [
+        func.date(history.c.timestamp).label('day'),
+        func.coalesce(history.c.matched_course_id, literal_column('0')).label('matched_course_id'),
+        func.coalesce(history.c.decision, literal_column("'unknown'")).label('decision'),
+        _score_bucket_sql(score).label('score_bucket')
+    ]
+    grouped = select(*columns, func.count().label('requests'), func.sum(score).label('score_total')).group_by(*columns)
+    connection.execute(stats.delete())
+    connection.execute(insert(stats).from_select(
+        ['day', 'matched_course_id', 'decision', 'score_bucket', 'requests', 'score_total'], grouped
+    ))
+
+class PlanJob(Base):
+    __tablename__ = 'plan_jobs'
+    id = Column(String(32), primary_key=True)  # uuid4 hex, handed to the client
+    user_id = Column(Integer, ForeignKey('users.id'))
+    status = Column(String(20), nullable=False, default='queued')  # queued, running, done, failed
+    total = Column(Integer, default=0)
+    completed = Column(Integer, default=0)
+    input_data = Column(Text)  # JSON list of input courses
+    options = Column(Text)  # JSON: catalog filters, one_to_one
+    results = Column(Text)  # JSON list, appended as chunks finish
+    overall_score = Column(Float)
+    decision = Column(String(20))
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime)  # Set by the worker when it starts and after every chunk
+    finished_at = Column(DateTime)
+    user = relationship("User")
+
+class ComparisonCacheEntry(Base):
+    __tablename__ = 'comparison_cache'
+    key = Column(String(64), primary_key=True)  # sha256 of compare type, normalized input, filters, catalog version
+    catalog_version = Column(String(64), index=True)
+    value = Column(Text, nullable=False)  # JSON list of [course_id, score] hits
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class Revision(Base):
+    """Named change counters (e.g. 'catalog'), bumped in the transaction that makes the change."""
+    __tablename__ = 'revisions'
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+# Mapped classes whose inserts, updates and deletes bump a revision
+_REVISIONED = ((UniversityCourse, 'catalog'), (CourseEmbedding, 'catalog'))
+
+def bump_revision(session, name):
+    """
+    Increment a revision inside the session's transaction. Bulk statements
+    (insert()/update() executemany) skip the flush hook below and call this
+    themselves.
+    """
+    revisions = Revision.__table__
+    connection = session.connection()
+    if connection.execute(update(revisions).where(revisions.c.name == name).values(value=revisions.c.value + 1)).rowcount == 0:
+        connection.execute(insert(revisions).values(name=name, value=1))
+    session.info.setdefault('bumped_revisions', set()).add(name)
+
+def read_revision(session, name):
+    return session.query(Revision.value).filter(Revision.name == name).scalar() or 0
+
+@event.listens_for(Session, 'after_flush')
+def _bump_revisions(session, flush_context):
+    changed = list(session.new) + [obj for obj in session.dirty if session.is_modified(obj)] + list(session.deleted)
+    for name in {name for obj in changed for cls, name in _REVISIONED if isinstance(obj, cls)}:
+        bump_revision(session, name)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_revisions(session):
+    session.info.pop('bumped_revisions', None)
+
 class Feedback(Base):
     __tablename__ = 'feedbacks'
     id = Column(Integer, primary_key=True)
@@ -67,4 +252,23 @@ class Feedback(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     user = relationship("User")
 
-Base.metadata.create_all(engine)
\ No newline at end of file
+_backfill_stats = not inspect(engine).has_table(HistoryStats.__tablename__)
+Base.metadata.create_all(engine)
+
+def _upgrade_schema():
+    """create_all only makes missing tables; add columns and indexes that newer models declare."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        with engine.begin() as conn:
+            for column in missing:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}'))
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+_upgrade_schema()
+
+if _backfill_stats:
+    with engine.begin() as conn:
+        rebuild_history_stats(conn)
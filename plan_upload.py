@@ -0,0 +1,149 @@
+"""
+Streaming parsers for uploaded plan files.
+
+Rows are read one at a time straight from the upload stream (csv.DictReader
+for CSV, raw_decode over a sliding buffer for a JSON array), so nothing is
+written to disk and a file is rejected as soon as it crosses the byte or row
+limit instead of after it has been loaded.
+"""
+import codecs
+import csv
+import io
+import json
+
+class PlanUploadError(ValueError):
+    pass
+
+def format_size(n_bytes):
+    """Byte limit for messages: KB from 1 KB up, plain bytes below."""
+    return f"{n_bytes // 1024} KB" if n_bytes >= 1024 else f"{n_bytes} bytes"
+
+class _LimitedReader(io.RawIOBase):
+    """Binary stream wrapper that raises once more than max_bytes have been read."""
+    def __init__(self, stream, max_bytes):
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        self._read += len(data)
+        if self._max_bytes and self._read > self._max_bytes:
+            raise PlanUploadError(f"File is larger than {format_size(self._max_bytes)}")
+        buffer[:len(data)] = data
+        return len(data)
+
+def _normalize(row, line):
+    if not isinstance(row, dict):
+        raise PlanUploadError(f"Row {line}: expected an object with title, description, credits")
+    title = row.get('title')
+    description = row.get('description')
+    if not title or not description:
+        raise PlanUploadError(f"Row {line}: title and description are required")
+    return {'title': str(title), 'description': str(description), 'credits': row.get('credits')}
+
+def iter_csv_rows(binary_stream, normalize=_normalize):
+    text = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    for line, row in enumerate(csv.DictReader(text), start=1):
+        yield normalize(row, line)
+
+def iter_json_rows(binary_stream, chunk_size=64 * 1024, normalize=_normalize):
+    """Yield the objects of a top-level JSON array without loading the whole document."""
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+    expect_value = True  # After '[' or ','; otherwise ',' or ']' must come next
+    line = 0
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = binary_stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + reader.decode(chunk, final=not chunk)
+        pos = 0
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise PlanUploadError("Unexpected end of JSON")
+            fill()
+            continue
+        char = buffer[pos]
+        if not started:
+            if char != '[':
+                raise PlanUploadError("JSON plan must be an array of courses")
+            started = True
+            pos += 1
+        elif char == ']' and (not expect_value or line == 0):
+            pos += 1
+            # Only whitespace may follow the array
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buffer):
+                    raise PlanUploadError("Invalid JSON: unexpected data after the array")
+                if eof:
+                    return
+                fill()
+        elif char == ',' and not expect_value:
+            expect_value = True
+            pos += 1
+        elif not expect_value:
+            raise PlanUploadError("Invalid JSON: expected ',' or ']'")
+        else:
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise PlanUploadError("Invalid JSON")
+                fill()  # Object continues in the next chunk
+                continue
+            if end == len(buffer) and not eof:
+                fill()  # A number or literal might continue past the buffer; re-read with more data
+                continue
+            line += 1
+            pos = end
+            expect_value = False
+            yield normalize(obj, line)
+
+def iter_upload_rows(stream, filename, max_bytes, normalize=_normalize):
+    """Rows of a CSV/JSON upload (picked by extension), each passed through normalize(row, line)."""
+    stream = io.BufferedReader(_LimitedReader(stream, max_bytes))
+    filename = (filename or '').lower()
+    if filename.endswith('.csv'):
+        return iter_csv_rows(stream, normalize=normalize)
+    if filename.endswith('.json'):
+        return iter_json_rows(stream, normalize=normalize)
+    raise PlanUploadError("File must be a .csv or .json file")
+
+def normalize_plan_rows(rows, max_rows):
+    """Validate an already-decoded list of course objects (e.g. a JSON request body) like an uploaded plan."""
+    if not isinstance(rows, list) or not rows:
+        raise PlanUploadError("Plan contains no courses")
+    if len(rows) > max_rows:
+        raise PlanUploadError(f"Plan has more than {max_rows} courses")
+    return [_normalize(row, line) for line, row in enumerate(rows, start=1)]
+
+def parse_plan_upload(file, max_bytes, max_rows):
+    """Parse an uploaded CSV/JSON plan into a list of {'title', 'description', 'credits'} dicts."""
+    rows = iter_upload_rows(file.stream, file.filename, max_bytes)
+    input_plan = []
+    try:
+        for row in rows:
+            if len(input_plan) >= max_rows:
+                raise PlanUploadError(f"Plan has more than {max_rows} courses")
+            input_plan.append(row)
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise PlanUploadError(f"Could not read plan: {e}")
+    if not input_plan:
+        raise PlanUploadError("Plan contains no courses")
+    return input_plan
@@ -34,5 +34,10 @@ sample_feedback = Feedback(user_id=student.id, message="Great tool! Easy to use.
 session.add(sample_feedback)
 
 session.commit()
+
+# Precompute catalog embeddings so the first comparison doesn't have to
+from embedding_store import refresh_course_embeddings
+refresh_course_embeddings(session, courses)
+
 session.close()
 print("Data populated successfully!")
\ No newline at end of file
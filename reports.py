@@ -0,0 +1,129 @@
+"""
+PDF equivalency reports.
+
+Reports are rendered into memory and cached by (history id, content
+version), where the version is a hash of every field that ends up on the
+page, so an unchanged row is only drawn once and an edited one is redrawn.
+Bulk exports render in a process pool and are streamed back as a ZIP
+while later reports are still being drawn.
+
+This module only depends on reportlab (and the stdlib-only metrics module)
+so that spawned pool workers start quickly.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+import metrics
+
+_cache = OrderedDict()  # (history id, version) -> pdf bytes
+_cache_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+def report_data(history):
+    """The plain, picklable fields of a ComparisonHistory row that a report shows."""
+    return {
+        'id': history.id,
+        'user': history.user.username if history.user else 'Anon',
+        'input_data': (history.input_data or '')[:100],  # Truncated on the page
+        'score': history.equivalency_score or 0.0,
+        'decision': history.decision,
+        'timestamp': str(history.timestamp)
+    }
+
+def report_version(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+def render_report(data):
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    c.drawString(100, 750, "Dhofar University Equivalency Report")
+    c.drawString(100, 730, f"User: {data['user']}")
+    c.drawString(100, 710, f"Input: {data['input_data']}...")
+    c.drawString(100, 690, f"Score: {data['score']:.1f}%")
+    c.drawString(100, 670, f"Decision: {data['decision']}")
+    c.drawString(100, 650, f"Date: {data['timestamp']}")
+    c.save()
+    return buffer.getvalue()
+
+def _cached(key):
+    with _cache_lock:
+        pdf = _cache.get(key)
+        if pdf is not None:
+            _cache.move_to_end(key)
+        return pdf
+
+def _remember(key, pdf, max_entries):
+    with _cache_lock:
+        _cache[key] = pdf
+        _cache.move_to_end(key)
+        while len(_cache) > max_entries:
+            _cache.popitem(last=False)
+
+def get_report(data, max_entries=256):
+    """PDF bytes for one report, from the cache when this version was drawn before."""
+    key = (data['id'], report_version(data))
+    pdf = _cached(key)
+    metrics.cache_result('report', int(pdf is not None), int(pdf is None))
+    if pdf is None:
+        pdf = render_report(data)
+        _remember(key, pdf, max_entries)
+    return pdf
+
+def _get_pool(workers):
+    # spawn, not fork: the serving process has worker threads (plan jobs, encode batcher)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+class _ZipStream:
+    """Write-only sink for ZipFile; whatever was written is handed out by drain()."""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_reports_zip(rows, workers=2, max_entries=256, pool_threshold=8):
+    """
+    Yield a ZIP archive of reports for rows (report_data dicts) chunk by chunk.
+    Cached reports are reused; the rest are drawn in a process pool once
+    there are at least pool_threshold of them.
+    """
+    keys = [(data['id'], report_version(data)) for data in rows]
+    missing = [data for data, key in zip(rows, keys) if _cached(key) is None]
+    metrics.cache_result('report', len(rows) - len(missing), len(missing))
+    if len(missing) >= pool_threshold:
+        rendered = _get_pool(workers).map(render_report, missing, chunksize=8)
+    else:
+        rendered = map(render_report, missing)
+    rendered = iter(rendered)
+
+    sink = _ZipStream()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for data, key in zip(rows, keys):
+            pdf = _cached(key)
+            if pdf is None:
+                pdf = next(rendered)
+                _remember(key, pdf, max_entries)
+            archive.writestr(f"report_{data['id']}.pdf", pdf)
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,177 @@
+"""
+Memoized comparison results.
+
+Single and set comparisons are keyed on the compare type, the input
+descriptions (whitespace-collapsed; case is kept, since spaCy tags "Python"
+and "python" differently), the catalog filters, k and the catalog version
+(embedding_store.catalog_version), and map to the ranked [(course_id, score)]
+hits. Since the version is part of the key, any
+catalog change makes older entries unreachable; they are also purged the
+first time a new version is seen.
+
+Backends (RESULT_CACHE):
+    memory  per-process LRU with a TTL
+    db      comparison_cache table, shared by every gunicorn worker
+    off     no caching
+Lookups are counted in equiv_cache_requests_total{cache="result"}.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from models import Session, ComparisonCacheEntry
+import metrics
+from config import EMBEDDING_MODEL, RESULT_CACHE, RESULT_CACHE_SIZE, RESULT_CACHE_TTL
+
+def normalize_text(text):
+    return ' '.join((text or '').split())
+
+def version_key(version):
+    return hashlib.sha1(repr((EMBEDDING_MODEL, version)).encode('utf-8')).hexdigest()
+
+def make_key(compare_type, descs, filters, k, version):
+    payload = json.dumps([compare_type, [normalize_text(d) for d in descs], filters, k, version_key(version)], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class MemoryBackend:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (stored at, version key, hits)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key, version, hits):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), version, hits)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def purge(self, keep_version):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[1] != keep_version]:
+                del self._entries[key]
+
+class DBBackend:
+    """Entries in the comparison_cache table; each call uses its own short session."""
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._puts = 0
+
+    def get(self, key):
+        session = Session()
+        try:
+            entry = session.get(ComparisonCacheEntry, key)
+            if entry is None:
+                return None
+            if self.ttl and entry.created_at < datetime.utcnow() - timedelta(seconds=self.ttl):
+                return None
+            return [tuple(hit) for hit in json.loads(entry.value)]
+        finally:
+            session.close()
+
+    def put(self, key, version, hits):
+        session = Session()
+        try:
+            session.merge(ComparisonCacheEntry(key=key, catalog_version=version, value=json.dumps(hits), created_at=datetime.utcnow()))
+            session.commit()
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._trim(session)
+        except Exception as e:
+            # Another worker stored the same key first, or the table is busy; caching is best effort
+            session.rollback()
+            logging.warning(f"Result cache write failed: {e}")
+        finally:
+            session.close()
+
+    def _trim(self, session):
+        if self.ttl:
+            session.query(ComparisonCacheEntry).filter(
+                ComparisonCacheEntry.created_at < datetime.utcnow() - timedelta(seconds=self.ttl)
+            ).delete(synchronize_session=False)
+        cutoff = session.query(ComparisonCacheEntry.created_at).order_by(
+            ComparisonCacheEntry.created_at.desc()
+        ).offset(self.max_entries).limit(1).scalar()
+        if cutoff is not None:
+            session.query(ComparisonCacheEntry).filter(
+                ComparisonCacheEntry.created_at <= cutoff
+            ).delete(synchronize_session=False)
+        session.commit()
+
+    def purge(self, keep_version):
+        session = Session()
+        try:
+            session.query(ComparisonCacheEntry).filter(
+                ComparisonCacheEntry.catalog_version != keep_version
+            ).delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+_BACKENDS = {'memory': MemoryBackend, 'db': DBBackend}
+_backend = _BACKENDS[RESULT_CACHE](RESULT_CACHE_SIZE, RESULT_CACHE_TTL) if RESULT_CACHE in _BACKENDS else None
+_seen_version = None
+_version_lock = threading.Lock()
+
+def _check_version(version):
+    global _seen_version
+    with _version_lock:
+        if version == _seen_version:
+            return
+        if _seen_version is not None:
+            logging.info("Catalog changed; purging cached comparison results")
+            _backend.purge(version)
+        _seen_version = version
+
+def cached_search(compare_type, descs, filters, k, version, search):
+    """
+    Hits for this comparison from the cache, or from search() (stored for
+    next time). version is the catalog version the hits are computed against.
+    """
+    if _backend is None or version is None:
+        return search()
+    vkey = version_key(version)
+    _check_version(vkey)
+    key = make_key(compare_type, descs, filters, k, version)
+    hits = _backend.get(key)
+    metrics.cache_result('result', int(hits is not None), int(hits is None))
+    if hits is None:
+        hits = [(int(course_id), float(score)) for course_id, score in search()]
+        _backend.put(key, vkey, hits)
+    return hits
+
+def cached_search_many(compare_type, queries, filters, k, version, search):
+    """
+    cached_search for a batch of comparisons (queries is a list of descs
+    lists). search(missing) is called once with the queries not found in the
+    cache and returns their hits in the same order.
+    """
+    if _backend is None or version is None:
+        return search(queries)
+    vkey = version_key(version)
+    _check_version(vkey)
+    keys = [make_key(compare_type, descs, filters, k, version) for descs in queries]
+    results = [_backend.get(key) for key in keys]
+    missing = [i for i, hits in enumerate(results) if hits is None]
+    metrics.cache_result('result', len(keys) - len(missing), len(missing))
+    if missing:
+        for i, hits in zip(missing, search([queries[i] for i in missing])):
+            results[i] = [(int(course_id), float(score)) for course_id, score in hits]
+            _backend.put(keys[i], vkey, results[i])
+    return results
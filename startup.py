@@ -0,0 +1,76 @@
+"""
+Startup warm-up and readiness.
+
+preload() loads the SentenceTransformer and every catalog embedding (via the
+catalog vector index) once. Under gunicorn it runs in the master before
+workers fork (see gunicorn.conf.py), so workers share that memory
+copy-on-write instead of each loading its own copy. warm_up() then runs one
+inference in the serving process; only after that does /ready report ready.
+Every phase is timed and logged.
+"""
+import gc
+import logging
+import threading
+import time
+import torch
+import ai_comparator
+from models import Session, engine, read_engine
+from embedding_store import get_catalog_index
+from jobs import expire_stale_jobs
+
+_ready = threading.Event()
+_torch_threads = None
+phases = {'spacy_load': round(ai_comparator.SPACY_LOAD_SECONDS, 3)}
+
+def _phase(name, fn):
+    started = time.perf_counter()
+    result = fn()
+    phases[name] = round(time.perf_counter() - started, 3)
+    logging.info(f"Startup phase {name}: {phases[name]:.2f}s")
+    return result
+
+def _load_catalog():
+    session = Session()
+    try:
+        return len(get_catalog_index(session))
+    finally:
+        session.close()
+
+def preload(fork=True):
+    """Load models and catalog embeddings; with fork=True, leave the process safe to fork."""
+    global _torch_threads
+    if fork:
+        # An OpenMP pool started in the master is unusable in forked children;
+        # keep torch single-threaded here and restore the count in warm_up()
+        _torch_threads = torch.get_num_threads()
+        torch.set_num_threads(1)
+    logging.info(f"Startup phase spacy_load: {phases['spacy_load']:.2f}s")
+    _phase('model_load', ai_comparator.get_model)
+    courses = _phase('catalog_load', _load_catalog)
+    logging.info(f"Catalog index holds {courses} courses")
+    # Jobs left queued/running by workers of a previous run
+    session = Session()
+    try:
+        expire_stale_jobs(session)
+    finally:
+        session.close()
+    if not fork:
+        return
+    # Workers must open their own DB connections, not inherit the master's
+    engine.dispose()
+    read_engine.dispose()
+    # Keep the loaded objects out of future GC passes so collections don't touch (and copy) shared pages
+    gc.freeze()
+
+def warm_up():
+    """Run one inference in this process, then mark it ready."""
+    if _torch_threads:
+        torch.set_num_threads(_torch_threads)
+    def infer():
+        ai_comparator.encode_texts(["Introduction to programming: variables, loops and functions."])
+    _phase('warmup_inference', infer)
+    _ready.set()
+    logging.info("Ready to serve comparisons")
+
+def is_ready():
+    return _ready.is_set()
@@ -0,0 +1,28 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Before config is imported: a throwaway SQLite database and no wait between catalog revision reads
+_db_dir = tempfile.mkdtemp(prefix='equivalency-tests-')
+os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ['CATALOG_SYNC_INTERVAL'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def session():
+    """A session on emptied catalog tables, with the stub encoder and no catalog index loaded."""
+    import embedding_store
+    from benchmarks.stub_encoder import install
+    from models import Session, CourseEmbedding, UniversityCourse, University, Revision
+    install()
+    db = Session()
+    for model in (CourseEmbedding, UniversityCourse, University, Revision):
+        db.query(model).delete()
+    db.commit()
+    embedding_store._index = None
+    embedding_store._index_version = None
+    embedding_store._index_marks = None
+    embedding_store._next_check = 0.0
+    yield db
+    db.close()
@@ -0,0 +1,62 @@
+from sqlalchemy import update
+from embedding_store import get_catalog_index, refresh_course_embeddings
+from ai_comparator import encode_texts
+from models import CourseEmbedding, University, UniversityCourse
+
+def add_course(session, university, title, description):
+    """What /add_course does: commit the course, then store its embedding."""
+    course = UniversityCourse(title=title, description=description, credits=3, department='CS',
+                              language='en', university_id=university.id)
+    session.add(course)
+    session.commit()
+    refresh_course_embeddings(session, [course])
+    return course
+
+def best_match(session, description, university):
+    return get_catalog_index(session).search(encode_texts([description])[0], k=1, university_id=university.id)[0][0]
+
+def test_sync_after_upgrade_without_timestamps(session):
+    # _upgrade_schema adds updated_at as NULL to every existing row
+    university = University(name='Dhofar University')
+    session.add(university)
+    session.commit()
+    old = add_course(session, university, 'Databases', 'relational models normalization queries')
+    session.execute(update(UniversityCourse).values(updated_at=None))
+    session.execute(update(CourseEmbedding).values(updated_at=None))
+    session.commit()
+    assert len(get_catalog_index(session)) == 1
+
+    new = add_course(session, university, 'Networks', 'routing protocols packets switching')
+    assert best_match(session, 'routing protocols packets switching', university) == new.id
+    assert best_match(session, 'relational models normalization queries', university) == old.id
+
+    old.description = 'compilers parsing grammars'
+    session.commit()
+    assert best_match(session, 'compilers parsing grammars', university) == old.id
+
+def test_sync_after_building_an_empty_index(session):
+    university = University(name='Dhofar University')
+    session.add(university)
+    session.commit()
+    assert len(get_catalog_index(session)) == 0
+
+    course = add_course(session, university, 'Networks', 'routing protocols packets switching')
+    assert len(get_catalog_index(session)) == 1
+    assert best_match(session, 'routing protocols packets switching', university) == course.id
+
+def test_sync_re_adds_only_changed_courses(session, monkeypatch):
+    university = University(name='Dhofar University')
+    session.add(university)
+    session.commit()
+    courses = [add_course(session, university, f'Course {i}', f'topic{i} lectures labs') for i in range(5)]
+    index = get_catalog_index(session)
+    added = []
+    original_add = index.add
+    monkeypatch.setattr(index, 'add', lambda ids, *args, **kwargs: added.extend(ids) or original_add(ids, *args, **kwargs))
+
+    new = add_course(session, university, 'Networks', 'routing protocols packets switching')
+    courses[0].department = 'Math'
+    session.commit()
+    get_catalog_index(session)
+    assert sorted(added) == sorted([new.id, courses[0].id])
+    assert index.search(encode_texts(['topic0 lectures labs'])[0], k=1, department='Math')[0][0] == courses[0].id
@@ -0,0 +1,12 @@
+import numpy as np
+from vector_index import VectorIndex
+
+def test_adding_after_share_keeps_the_mapped_block(tmp_path):
+    vectors = np.random.default_rng(0).normal(size=(60, 16)).astype(np.float32)
+    index = VectorIndex(16, dtype='int8')
+    index.add(np.arange(50), vectors[:50])
+    index.share_vectors(str(tmp_path / 'catalog'))
+    index.add(np.arange(50, 60), vectors[50:])
+    index.add([3], vectors[3:4])
+    assert isinstance(index._base_vectors, np.memmap)
+    assert [hits[0][0] for hits in index.search(vectors[[3, 55]], k=1)] == [3, 55]
@@ -0,0 +1,52 @@
+"""
+In-process cache of user identity for the Flask-Login loader.
+
+load_user runs on every authenticated request but only needs a user's id and
+role, so those are kept here for USER_CACHE_TTL seconds instead of being
+queried each time. Updates and deletes made through the ORM drop the entry
+in the process that made them; other workers pick the change up once their
+entry expires. Admin roles are never cached, so demoting or deleting an
+admin takes effect on that admin's next request in every worker.
+"""
+import threading
+import time
+from sqlalchemy import event
+from models import Session, User
+import metrics
+from config import USER_CACHE_TTL
+
+_users = {}  # user id -> (expires at, role)
+_lock = threading.Lock()
+
+def remember(user_id, role):
+    if USER_CACHE_TTL and role != 'admin':
+        with _lock:
+            _users[user_id] = (time.monotonic() + USER_CACHE_TTL, role)
+
+def forget(user_id):
+    with _lock:
+        _users.pop(user_id, None)
+
+def get_role(user_id):
+    """Role of a user, or None if the user doesn't exist."""
+    with _lock:
+        entry = _users.get(user_id)
+    if entry is not None and entry[0] > time.monotonic():
+        metrics.cache_result('user', 1, 0)
+        return entry[1]
+    metrics.cache_result('user', 0, 1)
+    session = Session()
+    try:
+        role = session.query(User.role).filter(User.id == user_id).scalar()
+    finally:
+        session.close()
+    if role is None or role == 'admin':
+        forget(user_id)
+    else:
+        remember(user_id, role)
+    return role
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    forget(target.id)
@@ -0,0 +1,425 @@
+"""
+In-process vector index over course embeddings.
+
+Vectors are L2-normalised on insert, so inner product is cosine similarity.
+Two search modes:
+- 'flat': exact scan over the rows that pass the filters.
+- 'ivf': rows are bucketed under spherical k-means centroids and a query only
+  scans the nprobe closest buckets. If the filters leave fewer than k rows in
+  those buckets the query falls back to an exact scan, so selective filters
+  never return short lists.
+Until the index holds train_min vectors an 'ivf' index behaves like 'flat'.
+
+Vectors are stored as float32, float16, or int8 with one float32 scale per
+vector (see quantize); scoring dequantizes rows in chunks and accumulates in
+float32. share_vectors() moves the stored matrix into a memory-mapped file so
+that every worker mapping the same file shares one copy in the page cache;
+rows added afterwards go to a private tail, leaving the mapped block shared.
+"""
+import glob
+import hashlib
+import logging
+import os
+import threading
+from types import SimpleNamespace
+import numpy as np
+
+DTYPES = ('float32', 'float16', 'int8')
+_SCORE_CHUNK = 32768  # rows dequantized at a time while scoring
+
+def quantize(vectors, dtype='float32'):
+    """Encode an (n, dim) float32 matrix as (stored matrix, per-row float32 scales)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.ones(len(vectors), dtype=np.float32)
+    if dtype == 'int8':
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        return np.rint(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(dtype), scales
+
+def dequantize(stored, scales):
+    vectors = np.asarray(stored).astype(np.float32)
+    if stored.dtype == np.int8:
+        vectors *= np.asarray(scales, dtype=np.float32)[:, None]
+    return vectors
+
+class VectorIndex:
+    def __init__(self, dim, mode='flat', nlist=0, nprobe=8, train_min=5000, dtype='float32'):
+        if mode not in ('flat', 'ivf'):
+            raise ValueError(f"Unknown index mode: {mode}")
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown index dtype: {dtype}")
+        self.dim = dim
+        self.mode = mode
+        self.dtype = dtype
+        self.nlist = nlist  # 0 = sqrt(n) at training time
+        self.nprobe = nprobe
+        self.train_min = train_min
+
+        self._size = 0  # rows used, including removed ones
+        # Rows below _base live in the mapped block (share_vectors); _vectors/_scales hold row - _base
+        self._base = 0
+        self._base_vectors = np.zeros((0, dim), dtype=dtype)
+        self._base_scales = np.zeros(0, dtype=np.float32)
+        self._vectors = np.zeros((0, dim), dtype=dtype)
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._tags = np.zeros(0, dtype=np.int64)  # caller's version of each vector, see lookup()
+        self._university = np.zeros(0, dtype=np.int64)
+        self._department = np.zeros(0, dtype=np.int32)
+        self._language = np.zeros(0, dtype=np.int32)
+        self._active = np.zeros(0, dtype=bool)
+        self._row_of = {}  # course id -> row
+        self._codes = {'department': {}, 'language': {}}
+
+        # IVF state
+        self._centroids = None
+        self._trained_size = 0
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._list_rows = []  # bucket -> list of rows
+        self._list_arrays = {}  # bucket -> cached np array of rows
+
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def ids(self):
+        with self._lock:
+            return list(self._row_of)
+
+    @property
+    def trained(self):
+        return self._centroids is not None
+
+    @property
+    def nbytes(self):
+        """Bytes held by the stored vectors (and int8 scales) of the rows in use."""
+        tail = self._size - self._base
+        nbytes = self._base_vectors.nbytes + self._vectors[:tail].nbytes
+        if self.dtype == 'int8':
+            nbytes += self._base_scales.nbytes + self._scales[:tail].nbytes
+        return nbytes
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        if self._size + needed <= capacity:
+            return
+        new_capacity = max(1024, capacity * 2, self._size + needed)
+        def grown(arr, fill=0, offset=0):
+            shape = (new_capacity - offset,) + arr.shape[1:]
+            out = np.full(shape, fill, dtype=arr.dtype)
+            out[:self._size - offset] = arr[:self._size - offset]
+            return out
+        self._vectors = grown(self._vectors, offset=self._base)
+        self._scales = grown(self._scales, 1.0, offset=self._base)
+        self._ids = grown(self._ids)
+        self._tags = grown(self._tags, -1)
+        self._university = grown(self._university, -1)
+        self._department = grown(self._department, -1)
+        self._language = grown(self._language, -1)
+        self._active = grown(self._active, False)
+        self._assign = grown(self._assign, -1)
+
+    def _code(self, field, value, create=True):
+        if value is None:
+            return -1
+        codes = self._codes[field]
+        if value not in codes:
+            if not create:
+                return -2  # matches nothing
+            codes[value] = len(codes)
+        return codes[value]
+
+    def add(self, ids, vectors, university_ids=None, departments=None, languages=None, tags=None):
+        """
+        Insert or replace vectors; metadata lists line up with ids (None = unknown).
+        tags are non-negative ints stored with each vector (e.g. part of a
+        content hash), for the caller to tell stale rows apart via lookup().
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        stored, scales = quantize(vectors, self.dtype)
+        n = len(ids)
+        university_ids = university_ids if university_ids is not None else [None] * n
+        departments = departments if departments is not None else [None] * n
+        languages = languages if languages is not None else [None] * n
+        tags = tags if tags is not None else [-1] * n
+
+        with self._lock:
+            self._grow(n)
+            for i, (course_id, vector, uni, dept, lang, tag) in enumerate(zip(ids, vectors, university_ids, departments, languages, tags)):
+                course_id = int(course_id)
+                row = self._row_of.get(course_id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._row_of[course_id] = row
+                elif self.trained:
+                    self._unlist(row)
+                if row < self._base:
+                    # Copy-on-write: only the pages holding this row become private
+                    self._base_vectors[row] = stored[i]
+                    self._base_scales[row] = scales[i]
+                else:
+                    self._vectors[row - self._base] = stored[i]
+                    self._scales[row - self._base] = scales[i]
+                self._ids[row] = course_id
+                self._tags[row] = tag
+                self._university[row] = -1 if uni is None else int(uni)
+                self._department[row] = self._code('department', dept)
+                self._language[row] = self._code('language', lang)
+                self._active[row] = True
+                if self.trained:
+                    self._list(row, int(np.argmax(self._centroids @ vector)))
+
+    def lookup(self, ids):
+        """
+        (tags, vectors) for ids: the tag each was added with (-1 when it isn't
+        indexed) and its dequantized unit vector (zeros when it isn't).
+        """
+        tags = np.full(len(ids), -1, dtype=np.int64)
+        vectors = np.zeros((len(ids), self.dim), dtype=np.float32)
+        with self._lock:
+            rows = np.array([self._row_of.get(int(course_id), -1) for course_id in ids], dtype=np.int64)
+            found = rows >= 0
+            tags[found] = self._tags[rows[found]]
+            vectors[found] = self._decode(rows[found])
+        return tags, vectors
+
+    def stale(self, ids, tags, university_ids=None, departments=None, languages=None):
+        """Boolean mask of ids that aren't indexed or whose stored tag or metadata differ from the given ones."""
+        tags = np.asarray(tags, dtype=np.int64)
+        with self._lock:
+            rows = np.array([self._row_of.get(int(course_id), -1) for course_id in ids], dtype=np.int64)
+            found = rows >= 0
+            rows = rows[found]
+            differs = self._tags[rows] != tags[found]
+            if university_ids is not None:
+                given = np.array([-1 if uni is None else int(uni) for uni in university_ids], dtype=np.int64)
+                differs |= self._university[rows] != given[found]
+            for field, values, stored in (('department', departments, self._department), ('language', languages, self._language)):
+                if values is not None:
+                    given = np.array([self._code(field, value, create=False) for value in values], dtype=np.int32)
+                    differs |= stored[rows] != given[found]
+        mask = ~found
+        mask[found] = differs
+        return mask
+
+    def remove(self, ids):
+        with self._lock:
+            for course_id in ids:
+                row = self._row_of.pop(int(course_id), None)
+                if row is None:
+                    continue
+                self._active[row] = False
+                if self.trained:
+                    self._unlist(row)
+
+    def _list(self, row, bucket):
+        self._assign[row] = bucket
+        self._list_rows[bucket].append(row)
+        self._list_arrays.pop(bucket, None)
+
+    def _unlist(self, row):
+        bucket = int(self._assign[row])
+        if bucket >= 0:
+            self._list_rows[bucket].remove(row)
+            self._list_arrays.pop(bucket, None)
+            self._assign[row] = -1
+
+    def _bucket_rows(self, bucket):
+        rows = self._list_arrays.get(bucket)
+        if rows is None:
+            rows = np.fromiter(self._list_rows[bucket], dtype=np.int64)
+            self._list_arrays[bucket] = rows
+        return rows
+
+    def train(self, n_iter=10, seed=0):
+        """(Re)build the IVF buckets with spherical k-means over the current vectors."""
+        with self._lock:
+            rows = np.nonzero(self._active[:self._size])[0]
+            if len(rows) == 0:
+                return
+            data = self._decode(rows)
+            nlist = self.nlist or int(np.sqrt(len(rows)))
+            nlist = max(1, min(nlist, len(rows)))
+            rng = np.random.default_rng(seed)
+            sample = data[rng.choice(len(data), min(len(data), nlist * 64), replace=False)]
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            for _ in range(n_iter):
+                assign = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assign, sample)
+                norms = np.linalg.norm(sums, axis=1, keepdims=True)
+                filled = norms[:, 0] > 0
+                centroids[filled] = sums[filled] / norms[filled]
+
+            self._centroids = centroids
+            self._list_rows = [[] for _ in range(nlist)]
+            self._list_arrays = {}
+            self._assign[:] = -1
+            for start in range(0, len(rows), 8192):
+                chunk = rows[start:start + 8192]
+                buckets = np.argmax(self._decode(chunk) @ centroids.T, axis=1)
+                for row, bucket in zip(chunk, buckets):
+                    self._list(int(row), int(bucket))
+            self._trained_size = len(rows)
+            logging.info(f"Vector index trained: {len(rows)} vectors in {nlist} lists")
+
+    def _maybe_train(self):
+        if self.mode != 'ivf' or len(self) < self.train_min:
+            return
+        if not self.trained or len(self) > 4 * self._trained_size:
+            self.train()
+
+    def _snapshot(self):
+        """
+        The arrays a search reads, taken under the lock so scoring can run
+        without it. add() only writes rows in place or swaps in larger copies
+        (_grow), so rows below the snapshot's _size stay readable.
+        """
+        trained = self.mode == 'ivf' and self.trained
+        return SimpleNamespace(
+            _size=self._size, count=len(self._row_of), _base=self._base, _base_vectors=self._base_vectors,
+            _base_scales=self._base_scales, _vectors=self._vectors, _scales=self._scales,
+            _ids=self._ids, _active=self._active, _university=self._university, _department=self._department,
+            _language=self._language, centroids=self._centroids if trained else None,
+            lists=[self._bucket_rows(b) for b in range(len(self._list_rows))] if trained else None
+        )
+
+    def _gather(self, rows, state=None):
+        """Stored vectors and scales of rows, from the mapped block and/or the private tail."""
+        state = state or self
+        if not state._base:
+            return state._vectors[rows], state._scales[rows]
+        head = rows < state._base
+        if head.all():
+            return state._base_vectors[rows], state._base_scales[rows]
+        vectors = np.empty((len(rows), self.dim), dtype=state._vectors.dtype)
+        scales = np.empty(len(rows), dtype=np.float32)
+        vectors[head] = state._base_vectors[rows[head]]
+        scales[head] = state._base_scales[rows[head]]
+        tail = rows[~head] - state._base
+        vectors[~head] = state._vectors[tail]
+        scales[~head] = state._scales[tail]
+        return vectors, scales
+
+    def _decode(self, rows, state=None):
+        return dequantize(*self._gather(rows, state))
+
+    def _scores(self, queries, rows, state=None):
+        """(q, len(rows)) float32 inner products, dequantizing _SCORE_CHUNK rows at a time."""
+        state = state or self
+        if self.dtype == 'float32':
+            return queries @ self._gather(rows, state)[0].T
+        out = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for start in range(0, len(rows), _SCORE_CHUNK):
+            chunk = rows[start:start + _SCORE_CHUNK]
+            out[:, start:start + len(chunk)] = queries @ self._decode(chunk, state).T
+        return out
+
+    def share_vectors(self, prefix):
+        """
+        Move the stored vectors into memory-mapped files and map them
+        copy-on-write, so every process holding the same vectors shares one
+        copy in the page cache. Files are named prefix-<content digest>.*.npy:
+        a process finding files for identical content maps them instead of
+        writing its own, and files left behind under the prefix are removed.
+        """
+        with self._lock:
+            size = self._size
+            vectors, scales = self._gather(np.arange(size))
+            arrays = {'vectors': vectors, 'scales': scales, 'ids': self._ids[:size]}
+            digest = hashlib.sha1()
+            for array in arrays.values():
+                digest.update(np.ascontiguousarray(array).tobytes())
+            path = f"{prefix}-{digest.hexdigest()[:16]}"
+            files = {name: f"{path}.{name}.npy" for name in arrays}
+            try:
+                if not os.path.exists(files['ids']):
+                    # ids last: its presence marks a complete set
+                    for name, array in arrays.items():
+                        tmp = f"{files[name]}.{os.getpid()}.tmp"
+                        with open(tmp, 'wb') as f:
+                            np.save(f, np.ascontiguousarray(array))
+                        os.replace(tmp, files[name])
+                    for old in glob.glob(f"{glob.escape(prefix)}-*.npy"):
+                        if old not in files.values():
+                            os.remove(old)  # Processes still mapping it keep their pages
+                vectors = np.load(files['vectors'], mmap_mode='c')
+                scales = np.load(files['scales'], mmap_mode='c')
+            except (OSError, ValueError) as e:
+                logging.warning(f"Vector index stays in private memory, could not map {path}: {e}")
+                return
+            # Later rows go to a fresh private tail; _grow never copies the mapped block
+            self._base = size
+            self._base_vectors = vectors
+            self._base_scales = scales
+            self._vectors = np.zeros((0, self.dim), dtype=self.dtype)
+            self._scales = np.zeros(0, dtype=np.float32)
+            for name in ('_ids', '_tags', '_university', '_department', '_language', '_active', '_assign'):
+                setattr(self, name, getattr(self, name)[:size].copy())
+            logging.info(f"Vector index mapped from {files['vectors']} ({self.nbytes / 1e6:.1f} MB)")
+
+    def _filter(self, state, rows, university_id, department, language):
+        mask = state._active[rows]
+        if university_id is not None:
+            mask &= state._university[rows] == int(university_id)
+        if department is not None:
+            mask &= state._department[rows] == self._code('department', department, create=False)
+        if language is not None:
+            mask &= state._language[rows] == self._code('language', language, create=False)
+        return rows[mask]
+
+    def _top_k(self, state, rows, scores, k):
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(state._ids[rows[i]]), float(scores[i])) for i in top]
+
+    def search(self, queries, k=5, university_id=None, department=None, language=None):
+        """
+        Top-k (course_id, cosine) pairs, best first.
+        queries may be one vector (returns one list) or a (q, dim) matrix
+        (returns one list per row).
+        The lock is only held to (re)train and snapshot the arrays. With
+        filters on an IVF index, a subset no bigger than the rows nprobe lists
+        hold on average is scanned exactly; a larger one probes more lists, in
+        proportion to how much the filters remove, so recall matches the
+        unfiltered search.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            self._maybe_train()
+            state = self._snapshot()
+
+        filtered = any(value is not None for value in (university_id, department, language))
+        subset = None
+        if state.centroids is None or filtered:
+            subset = self._filter(state, np.arange(state._size), university_id, department, language)
+        nlist = len(state.centroids) if state.centroids is not None else 0
+        nprobe = min(self.nprobe, nlist)
+        if state.centroids is None or (filtered and len(subset) * nlist <= state.count * nprobe):
+            scores = self._scores(queries, subset, state)
+            results = [self._top_k(state, subset, row_scores, k) for row_scores in scores]
+        else:
+            if filtered:
+                nprobe = min(nlist, int(np.ceil(nprobe * state.count / max(len(subset), 1))))
+            results = []
+            probes = np.argsort(-(queries @ state.centroids.T), axis=1)[:, :nprobe]
+            for query, buckets in zip(queries, probes):
+                rows = np.concatenate([state.lists[int(b)] for b in buckets])
+                rows = self._filter(state, rows, university_id, department, language)
+                if len(rows) < k:
+                    if subset is None:
+                        subset = self._filter(state, np.arange(state._size), university_id, department, language)
+                    rows = subset
+                results.append(self._top_k(state, rows, self._scores(query[None, :], rows, state)[0], k))
+        return results[0] if single else results